@@ -0,0 +1,50 @@
+import os
+import threading
+
+# lazy: built on the first /admin request, on: built at startup (dedicated admin worker), off: not mounted
+ADMIN = os.environ.get("ADMIN", "lazy")
+
+
+# mounted at /admin in place of the starlette_admin app; starlette_admin is imported and the
+# ModelViews are built only when the admin is first used, so API-only workers never pay for them.
+# make_engine is called then too: the admin gets a pool of its own instead of the API's
+class LazyAdmin:
+    def __init__(self, make_engine, models, title):
+        self.make_engine = make_engine
+        self.models = models
+        self.title = title
+        self.admin = None
+        self.lock = threading.Lock()
+
+    def build(self):
+        with self.lock:
+            if self.admin is None:
+                from starlette.applications import Starlette
+                from starlette_admin.contrib.sqla import Admin
+                from admin_views import ScalableModelView
+
+                admin = Admin(self.make_engine(), title=self.title)
+                for model in self.models:
+                    admin.add_view(ScalableModelView(model))
+                # mount_to builds admin.app; the host app is only needed for that
+                admin.mount_to(Starlette())
+                self.admin = admin
+        return self.admin.app
+
+    # url_for("admin:...") resolves through the routes of the mounted app
+    @property
+    def routes(self):
+        return self.admin.app.routes if self.admin else []
+
+    async def __call__(self, scope, receive, send):
+        await self.build()(scope, receive, send)
+
+
+def mount_admin(app, make_engine, models, title="DataBase"):
+    if ADMIN == "off":
+        return None
+    admin = LazyAdmin(make_engine, models, title)
+    if ADMIN == "on":
+        admin.build()
+    app.mount("/admin", admin, name="admin")
+    return admin
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import anyio
+from sqlalchemy import false, func, inspect, select, text
+from sqlalchemy.orm import load_only, selectinload
+from starlette_admin.contrib.sqla import ModelView
+from starlette_admin.fields import RelationField
+
+from cache import response_cache
+from models import SEARCH_TABLES, search_table, match_query
+
+# counts and page boundaries are dropped when the table's response cache generation moves (a
+# commit in this process, or one seen by follow_changes) and otherwise after this many seconds
+ADMIN_COUNT_TTL = float(os.environ.get("ADMIN_COUNT_TTL", 30))
+# counts are exact up to here; above it the total is estimated from how far into the id range
+# the first ADMIN_COUNT_LIMIT matches reach
+ADMIN_COUNT_LIMIT = int(os.environ.get("ADMIN_COUNT_LIMIT", 10_000))
+PAGE_BOUNDARIES = 4096
+
+
+# the stock ModelView pages with OFFSET over full rows, counts with COUNT(*) and joins every
+# relation into the page query; this one is imported only when the lazy admin is built
+class ScalableModelView(ModelView):
+    def __init__(self, model, **kwargs):
+        # sorting is offered where an index leads with the column (a relation sorts by its foreign
+        # key), so no list page ends up sorting the whole table in a temp b-tree
+        indexed = {index.columns[0].key for index in model.__table__.indexes} | {column.key for column in model.__table__.primary_key}
+        mapper = inspect(model)
+        self.sortable_field_mapping = {
+            relation.key: getattr(model, column.key)
+            for relation in mapper.relationships for column in relation.local_columns if column.key in indexed
+        }
+        self.sortable_fields = [column.key for column in mapper.column_attrs if column.key in indexed] + list(self.sortable_field_mapping)
+        super().__init__(model, **kwargs)
+        self.lock = threading.Lock()
+        self.generation = None
+        self.counts = {}
+        # (listing, skip) -> last id of the page before, so "next page" is a seek instead of an OFFSET
+        self.boundaries = OrderedDict()
+
+    # forgets the cached counts and boundaries once the table was written
+    def check_generation(self):
+        generation = response_cache.generation({self.model.__tablename__})
+        with self.lock:
+            if generation != self.generation:
+                self.generation = generation
+                self.counts.clear()
+                self.boundaries.clear()
+
+    def fts_table(self):
+        table = self.model.__table__
+        return search_table(table) if table in SEARCH_TABLES.values() else None
+
+    # a number is looked up by id; names go through the FTS5 index where the table has one
+    def get_search_query(self, request, term):
+        if term.strip().isdigit():
+            return self.model.id == int(term)
+        fts = self.fts_table()
+        if fts is None:
+            return super().get_search_query(request, term)
+        match = match_query(term)
+        if not match:
+            return false()
+        return self.model.id.in_(text(f"SELECT rowid FROM {fts} WHERE {fts} MATCH :match").bindparams(match=match))
+
+    async def execute(self, request, stmt):
+        return await anyio.to_thread.run_sync(request.state.session.execute, stmt)
+
+    # only the displayed columns (and the foreign keys of displayed relations) are loaded;
+    # each displayed relation is fetched for the whole page with one IN query
+    def page_options(self, request):
+        fields = self.get_fields_list(request)
+        names = {field.name for field in fields}
+        relations = [field.name for field in fields if isinstance(field, RelationField)]
+        for name in relations:
+            names.update(column.key for column in getattr(self.model, name).property.local_columns)
+        columns = [getattr(self.model, name) for name in sorted(names & self._columns | {self.pk_attr})]
+        return [load_only(*columns), *(selectinload(getattr(self.model, name)) for name in relations)]
+
+    # the page is picked as ids only (a seek when sorted by id and the page before was seen),
+    # then only its rows are loaded. how far the listing reached is left for count(), so the
+    # pager always offers the page after a full one
+    async def find_all(self, request, skip=0, limit=100, q=None, sorts=None, filters=None):
+        if limit <= 0:
+            return await super().find_all(request, skip, limit, q, sorts, filters)
+        self.check_generation()
+        pk = self.model.id
+        sorts = list(sorts or [])
+        by_id = sorts in ([], [("id", "asc")], [("id", "desc")])
+        descending = sorts == [("id", "desc")]
+        listing = (q, str(filters), descending, limit)
+        ids = await self._apply_search_and_filters(request, select(pk), q, filters)
+        with self.lock:
+            boundary = self.boundaries.get((listing, skip)) if by_id else None
+        after = boundary[0] if boundary and time.monotonic() - boundary[1] < ADMIN_COUNT_TTL else None
+        if after is not None:
+            ids = ids.where(pk < after if descending else pk > after).order_by(pk.desc() if descending else pk)
+        elif by_id:
+            ids = ids.order_by(pk.desc() if descending else pk).offset(skip)
+        else:
+            ids = self.build_order_clauses(request, sorts, ids).offset(skip)
+        page = (await self.execute(request, ids.limit(limit))).scalars().all()
+        if not page:
+            return []
+        request.state.admin_reached = skip + len(page) + (len(page) == limit)
+        if by_id:
+            with self.lock:
+                self.boundaries[(listing, skip + limit)] = (page[-1], time.monotonic())
+                while len(self.boundaries) > PAGE_BOUNDARIES:
+                    self.boundaries.popitem(last=False)
+        rows = (await self.execute(request, select(self.model).where(pk.in_(page)).options(*self.page_options(request)))).scalars().all()
+        order = {value: index for index, value in enumerate(page)}
+        return sorted(rows, key=lambda row: order[row.id])
+
+    # cached per listing; past ADMIN_COUNT_LIMIT matches the density of the first matches in id
+    # order (a primary key scan, an equality index or an FTS rowid list, no sort) is scaled to the
+    # whole id range. never less than the listing has already reached
+    async def count(self, request, q=None, filters=None):
+        self.check_generation()
+        reached = getattr(request.state, "admin_reached", 0)
+        key = (q, str(filters))
+        with self.lock:
+            cached = self.counts.get(key)
+        if cached and time.monotonic() - cached[1] < ADMIN_COUNT_TTL:
+            return cached[0] if cached[2] else max(cached[0], reached)
+        ids = (await self._apply_search_and_filters(request, select(self.model.id), q, filters)).order_by(self.model.id).limit(ADMIN_COUNT_LIMIT + 1).subquery()
+        total, last = (await self.execute(request, select(func.count(), func.max(ids.c.id)))).one()
+        exact = total <= ADMIN_COUNT_LIMIT
+        if not exact:
+            first, top = (await self.execute(request, select(func.min(self.model.id), func.max(self.model.id)))).one()
+            total = max(total, round(total * (top - first + 1) / (last - first + 1)))
+        with self.lock:
+            self.counts[key] = (total, time.monotonic(), exact)
+        return total if exact else max(total, reached)
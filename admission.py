@@ -0,0 +1,171 @@
+import asyncio
+import inspect
+import os
+import time
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.util import await_only
+
+import profiling
+
+# ADMISSION=1: routes are sorted by tag into a "report" and a "crud" class, each with its own
+# concurrency limit and wait queue, and every statement a route runs is held to its time budget
+ADMISSION = os.environ.get("ADMISSION", "0") == "1"
+# the reports are CPU-bound (row building holds the GIL), more than one per core only slows everything
+REPORT_CONCURRENCY = int(os.environ.get("REPORT_CONCURRENCY", os.cpu_count() or 1))
+REPORT_QUEUE = int(os.environ.get("REPORT_QUEUE", 16))
+REPORT_BUDGET = float(os.environ.get("REPORT_BUDGET", 5))
+CRUD_CONCURRENCY = int(os.environ.get("CRUD_CONCURRENCY", 16))
+CRUD_QUEUE = int(os.environ.get("CRUD_QUEUE", 256))
+CRUD_BUDGET = float(os.environ.get("CRUD_BUDGET", 1))
+RETRY_AFTER = int(os.environ.get("RETRY_AFTER", 1))
+# sqlite VM instructions between two deadline checks
+PROGRESS_STEPS = 1000
+
+ROUTE_TAGS = {
+    "report": {"Queries", "Analytics", "Search", "Terms"},
+    "crud": {"CRUD", "Bulk"},
+}
+
+deadline = ContextVar("deadline", default=None)
+
+METRICS = {
+    "queue_depth": profiling.GaugeMetric("admission_queue_depth", "Requests waiting for a slot"),
+    "in_flight": profiling.GaugeMetric("admission_in_flight", "Requests holding a slot"),
+    "wait": profiling.Histogram("admission_wait_seconds", "Time spent waiting for a slot", profiling.SECONDS),
+    "rejected": profiling.CounterMetric("admission_rejected_total", "Requests shed with 503 because the queue was full"),
+    "timed_out": profiling.CounterMetric("admission_timed_out_total", "Requests whose SQL was interrupted over the time budget"),
+}
+profiling.METRICS.update(METRICS)
+
+
+# overrides the class budget (seconds) of one route; goes next to @replica_read
+def time_budget(seconds):
+    def wrap(func):
+        func.time_budget = seconds
+        return func
+    return wrap
+
+
+# a slot is only held while the endpoint runs; cache hits never reach it
+class Limiter:
+    def __init__(self, name, concurrency, queue, budget):
+        self.labels = (("class", name),)
+        self.concurrency = concurrency
+        self.queue = queue
+        self.budget = budget
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.waiting = 0
+        self.active = 0
+
+    def publish(self):
+        with profiling.metrics_lock:
+            METRICS["queue_depth"].set(self.labels, self.waiting)
+            METRICS["in_flight"].set(self.labels, self.active)
+
+    async def acquire(self):
+        if self.semaphore.locked() and self.waiting >= self.queue:
+            with profiling.metrics_lock:
+                METRICS["rejected"].inc(self.labels)
+            raise HTTPException(status_code=503, detail="Server is busy, retry later", headers={"Retry-After": str(RETRY_AFTER)})
+        self.waiting += 1
+        self.publish()
+        started = time.perf_counter()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        self.publish()
+        with profiling.metrics_lock:
+            METRICS["wait"].observe(self.labels, time.perf_counter() - started)
+
+    def release(self):
+        self.active -= 1
+        self.semaphore.release()
+        self.publish()
+
+
+LIMITERS = {
+    "report": Limiter("report", REPORT_CONCURRENCY, REPORT_QUEUE, REPORT_BUDGET),
+    "crud": Limiter("crud", CRUD_CONCURRENCY, CRUD_QUEUE, CRUD_BUDGET),
+}
+
+
+def route_class(tags):
+    for name, route_tags in ROUTE_TAGS.items():
+        if route_tags & set(tags or ()):
+            return name
+    return None
+
+
+# the endpoint becomes an async def that waits for a slot, sets the deadline and, for sync
+# endpoints, runs them in the threadpool itself, so a queued request holds no thread
+def admit(endpoint, limiter):
+    budget = getattr(endpoint, "time_budget", limiter.budget)
+    is_async = inspect.iscoroutinefunction(endpoint)
+
+    async def wrapper(*args, **kwargs):
+        await limiter.acquire()
+        token = deadline.set(time.monotonic() + budget)
+        try:
+            if is_async:
+                return await endpoint(*args, **kwargs)
+            return await run_in_threadpool(endpoint, *args, **kwargs)
+        except OperationalError as error:
+            if "interrupted" not in str(error.orig):
+                raise
+            with profiling.metrics_lock:
+                METRICS["timed_out"].inc(limiter.labels)
+            raise HTTPException(status_code=504, detail=f"Query exceeded its time budget of {budget:g}s")
+        finally:
+            deadline.reset(token)
+            limiter.release()
+
+    wrapper.__name__ = endpoint.__name__
+    wrapper.__doc__ = endpoint.__doc__
+    wrapper.__dict__.update(endpoint.__dict__)
+    wrapper.__signature__ = inspect.signature(endpoint)
+    return wrapper
+
+
+def admitted(route_class_):
+    class AdmittedRoute(route_class_):
+        def __init__(self, path, endpoint, **kwargs):
+            name = route_class(kwargs.get("tags"))
+            if name is not None:
+                endpoint = admit(endpoint, LIMITERS[name])
+            super().__init__(path, endpoint, **kwargs)
+
+    return AdmittedRoute
+
+
+# every connection gets a progress handler that interrupts the running statement once the
+# deadline stored in its pool record has passed; the deadline is copied from the request
+# context before each statement and cleared when the connection goes back to the pool
+def instrument_engine(engine):
+    @event.listens_for(engine, "connect")
+    def install_progress_handler(dbapi_connection, connection_record):
+        info = connection_record.info
+
+        def over_budget():
+            limit = info.get("deadline")
+            return limit is not None and time.monotonic() > limit
+
+        driver_connection = getattr(dbapi_connection, "driver_connection", dbapi_connection)
+        if driver_connection is dbapi_connection:
+            dbapi_connection.set_progress_handler(over_budget, PROGRESS_STEPS)
+        else:
+            await_only(driver_connection.set_progress_handler(over_budget, PROGRESS_STEPS))
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def set_deadline(conn, cursor, statement, parameters, context, executemany):
+        conn.info["deadline"] = deadline.get()
+
+    @event.listens_for(engine, "checkin")
+    def clear_deadline(dbapi_connection, connection_record):
+        connection_record.info.pop("deadline", None)
@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+from itertools import chain
+
+import numpy as np
+from sqlalchemy import text
+
+ANALYTICS_RELOAD = float(os.environ.get("ANALYTICS_RELOAD", 300))
+PERCENTILES = (25, 50, 75, 90)
+MARKS = (2, 3, 4, 5)
+
+
+def grow(array, needed):
+    if needed <= len(array):
+        return array
+    bigger = np.zeros(max(needed, 2 * len(array), 1024), dtype=array.dtype)
+    bigger[:len(array)] = array
+    return bigger
+
+
+# flattens the rows straight into an int64 buffer instead of building a list of Row objects
+def fetch_ints(connection, sql, parameters, width):
+    result = connection.exec_driver_sql(sql, parameters)
+    return np.fromiter(chain.from_iterable(result), dtype=np.int64).reshape(-1, width)
+
+
+# columnar copy of Marks(id, student_id, course_id, mark) plus a student -> group map;
+# deleted marks (and NULL marks) stay in place with mark = 0 until the next full reload.
+# ArchivedMarks (counts of closed terms) ride along as rows weighted by their count.
+# every write (this process, the other workers, bulk upserts, raw SQL) is picked up from the
+# change log after the seq of the last refresh, in commit order; a closed term (kept out of the
+# change log) or expired tombstones force a full reload
+class MarkStore:
+    def __init__(self, engine):
+        self.engine = engine
+        self.lock = threading.Lock()
+        self.ids = np.zeros(0, np.int64)
+        self.students = np.zeros(0, np.int32)
+        self.courses = np.zeros(0, np.int32)
+        self.marks = np.zeros(0, np.int8)
+        self.size = 0
+        self.seq = 0
+        self.terms = 0
+        self.group_of = np.zeros(0, np.int32)
+        self.archived = np.zeros((0, 4), np.int64)
+        self.loaded_at = 0.0
+        self.stale = True
+        self.groups_stale = True
+        self.pending = {}
+
+    # seq, horizon and terms are read before the rows, so a write in between is applied again
+    # from the change log next time rather than missed
+    def refresh(self):
+        with self.lock, self.engine.connect() as connection:
+            seq, horizon, terms = connection.execute(text("""SELECT (SELECT COALESCE(MAX(seq), 0) FROM Changes),
+                (SELECT COALESCE(MAX(seq), 0) FROM ChangeHorizon), (SELECT COUNT(*) FROM Terms)""")).one()
+            if self.stale or time.monotonic() - self.loaded_at > ANALYTICS_RELOAD or horizon > self.seq or terms != self.terms:
+                self.load(connection, seq, terms)
+            else:
+                if seq > self.seq:
+                    self.read_changes(connection, seq)
+                self.apply_pending()
+                self.append_new(connection)
+            if self.groups_stale:
+                self.load_groups(connection)
+
+    def read_changes(self, connection, seq):
+        changes = connection.execute(text("SELECT table_name, row_id, data FROM Changes WHERE seq > :after AND seq <= :seq "
+                                          "AND table_name IN ('Marks', 'Students') ORDER BY seq"), {"after": self.seq, "seq": seq})
+        for table, row_id, data in changes:
+            if table == "Students":
+                self.groups_stale = True
+            elif data is None:
+                self.pending[row_id] = None
+            else:
+                row = json.loads(data)
+                self.pending[row_id] = (row["student_id"], row["course_id"], row["mark"] or 0)
+        self.seq = seq
+
+    def load(self, connection, seq, terms):
+        self.size = 0
+        self.seq = seq
+        self.terms = terms
+        self.pending.clear()
+        self.append_new(connection, after_id=-1)
+        self.archived = fetch_ints(connection, "SELECT student_id, course_id, mark, count FROM ArchivedMarks", (), 4)
+        self.loaded_at = time.monotonic()
+        self.stale = False
+        self.groups_stale = True
+
+    def append_new(self, connection, after_id=None):
+        if after_id is None:
+            after_id = int(self.ids[self.size - 1]) if self.size else -1
+        rows = fetch_ints(connection, "SELECT id, student_id, course_id, COALESCE(mark, 0) FROM Marks WHERE id > ? ORDER BY id", (after_id,), 4)
+        end = self.size + len(rows)
+        self.ids = grow(self.ids, end)
+        self.students = grow(self.students, end)
+        self.courses = grow(self.courses, end)
+        self.marks = grow(self.marks, end)
+        self.ids[self.size:end] = rows[:, 0]
+        self.students[self.size:end] = rows[:, 1]
+        self.courses[self.size:end] = rows[:, 2]
+        self.marks[self.size:end] = rows[:, 3]
+        self.size = end
+
+    def apply_pending(self):
+        ids = self.ids[:self.size]
+        for mark_id, change in self.pending.items():
+            position = np.searchsorted(ids, mark_id)
+            if position == self.size or ids[position] != mark_id:
+                continue
+            if change is None:
+                change = (0, 0, 0)
+            student_id, course_id, mark = change
+            self.students[position] = student_id
+            self.courses[position] = course_id
+            self.marks[position] = mark
+        self.pending.clear()
+
+    def load_groups(self, connection):
+        rows = fetch_ints(connection, "SELECT id, group_id FROM Students", (), 2)
+        group_of = np.zeros(int(rows[:, 0].max()) + 1 if len(rows) else 1, np.int32)
+        group_of[rows[:, 0]] = rows[:, 1]
+        self.group_of = group_of
+        self.groups_stale = False
+
+    # live and archived columns plus the weight of each row, with marks of students that no
+    # longer exist dropped like the SQL joins do
+    def columns(self):
+        marks = np.concatenate((self.marks[:self.size], self.archived[:, 2]))
+        students = np.concatenate((self.students[:self.size], self.archived[:, 0]))
+        courses = np.concatenate((self.courses[:self.size], self.archived[:, 1]))
+        weights = np.concatenate((np.ones(self.size, np.int64), self.archived[:, 3]))
+        valid = (marks != 0) & (students < len(self.group_of))
+        valid[valid] = self.group_of[students[valid]] != 0
+        students = students[valid]
+        return students, courses[valid], self.group_of[students], marks[valid].astype(np.int64), weights[valid]
+
+    def keys(self, by):
+        students, courses, groups, marks, weights = self.columns()
+        return {"student": students, "course": courses, "group": groups}[by], marks, weights
+
+    def distribution(self, course_id=None, group_id=None):
+        with self.lock:
+            students, courses, groups, marks, weights = self.columns()
+        mask = np.ones(len(marks), bool)
+        if course_id is not None:
+            mask &= courses == course_id
+        if group_id is not None:
+            mask &= groups == group_id
+        counts = np.bincount(marks[mask], weights=weights[mask], minlength=6)
+        return {str(mark): int(counts[mark]) for mark in MARKS}
+
+    # count/mean/std from weighted bincounts, percentiles by sorting key * 8 + mark once and
+    # finding each key's nearest rank in the running total of the weights
+    def stats(self, by):
+        with self.lock:
+            keys, marks, weights = self.keys(by)
+        if not len(keys):
+            return []
+        counts = np.bincount(keys, weights=weights).astype(np.int64)
+        sums = np.bincount(keys, weights=marks * weights)
+        squares = np.bincount(keys, weights=marks * marks * weights)
+        present = np.nonzero(counts)[0]
+        n = counts[present]
+        mean = sums[present] / n
+        std = np.sqrt(np.maximum(squares[present] / n - mean * mean, 0))
+        combined = keys.astype(np.int64) * 8 + marks
+        order = np.argsort(combined, kind="stable")
+        ordered = combined[order]
+        running = np.cumsum(weights[order])
+        starts = np.concatenate(([0], np.cumsum(n)[:-1]))
+        result = {
+            "key": present.tolist(),
+            "count": n.tolist(),
+            "mean": np.round(mean, 3).tolist(),
+            "std": np.round(std, 3).tolist(),
+        }
+        for q in PERCENTILES:
+            result[f"p{q}"] = (ordered[np.searchsorted(running, starts + (n - 1) * q // 100, side="right")] & 7).tolist()
+        return [dict(zip(result, row)) for row in zip(*result.values())]
+
+    def above_group_average(self):
+        with self.lock:
+            students, courses, groups, marks, weights = self.columns()
+            group_of = self.group_of
+        if not len(students):
+            return []
+        student_counts = np.bincount(students, weights=weights)
+        student_sums = np.bincount(students, weights=marks * weights)
+        group_counts = np.bincount(groups, weights=weights)
+        group_sums = np.bincount(groups, weights=marks * weights)
+        present = np.nonzero(student_counts)[0]
+        student_average = student_sums[present] / student_counts[present]
+        group_ids = group_of[present]
+        group_average = group_sums[group_ids] / group_counts[group_ids]
+        above = student_sums[present] * group_counts[group_ids] >= group_sums[group_ids] * student_counts[present]
+        order = np.lexsort((-student_average[above], group_ids[above]))
+        return [
+            {"student_id": int(s), "group_id": int(g), "average_grade": round(float(a), 2), "group_average": round(float(ga), 2)}
+            for s, g, a, ga in zip(present[above][order], group_ids[above][order], student_average[above][order], group_average[above][order])
+        ]
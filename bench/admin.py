@@ -0,0 +1,121 @@
+# usage: python -m bench.admin [--marks 10000000] [--db existing.db]
+# admin list pages with the stock starlette_admin ModelView (on the API's engine, as the admin
+# was mounted before) and with ScalableModelView (on its own pool): median ms and SQL statements
+# per page, then GET /students/{id}/ latency while admin clients keep paging through Marks
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+
+PAGES = [
+    "/admin/mark/list",
+    "/admin/mark/list?page=2",
+    "/admin/mark/list?page=3",
+    "/admin/mark/list?page=50000",
+    "/admin/mark/list?sort=id__desc&page=2",
+    "/admin/mark/list?sort=student__asc&page=2",
+    "/admin/student/list?q=иван",
+    "/admin/student/list?q=12345",
+    "/admin/student/list?q=!!",
+    "/admin/lesson/list",
+]
+
+
+# the admin next to the API, mounted under the name its url_for calls expect
+def build(view_class, engine, models, api):
+    from starlette.applications import Starlette
+    from starlette.routing import Mount
+    from starlette_admin.contrib.sqla import Admin
+
+    admin = Admin(engine, title="bench", secret_key="bench")
+    for model in models:
+        admin.add_view(view_class(model))
+    admin.mount_to(Starlette())
+    return Starlette(routes=[Mount("/admin", admin.app, name="admin"), Mount("/", api)])
+
+
+async def page_timings(app, engine, runs):
+    from sqlalchemy import event
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+    transport = httpx.ASGITransport(app=app)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        for page in PAGES:
+            samples = []
+            for run in range(runs):
+                statements.clear()
+                started = time.perf_counter()
+                response = await http.get(page)
+                samples.append(time.perf_counter() - started)
+                assert response.status_code == 200, (page, response.status_code)
+            results[page] = {"ms": round(statistics.median(samples) * 1000, 1), "statements": len(statements)}
+    return results
+
+
+async def api_under_admin(app, students, seconds, admin_clients, api_clients):
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+    stop = time.perf_counter() + seconds
+
+    async def admin_client(index):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            page = 1 + index * 1000
+            while time.perf_counter() < stop:
+                await http.get(f"/admin/mark/list?page={page}")
+                page += 1
+
+    async def api_client(index):
+        rnd = random.Random(index)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            while time.perf_counter() < stop:
+                started = time.perf_counter()
+                await http.get(f"/students/{rnd.randint(1, students)}/")
+                latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(admin_client(i) for i in range(admin_clients)), *(api_client(i) for i in range(api_clients)))
+    latencies.sort()
+    return {"api_requests": len(latencies), "api_p50_ms": round(statistics.median(latencies) * 1000, 1),
+            "api_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--marks", type=int, default=10_000_000)
+    parser.add_argument("--students", type=int, default=200_000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--db", help="existing database generated by bench.seed (default: a fresh scratch one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "admin.db")
+        os.environ.update(DATABASE_URL=f"sqlite:///{os.path.abspath(path)}", CACHE_BACKEND="off", ADMIN="off")
+        import main as app_main
+        import database
+        from admin_views import ScalableModelView
+        from starlette_admin.contrib.sqla import ModelView
+
+        if not args.db:
+            from bench.seed import seed
+            seed(path, args.marks, students=args.students, lessons=args.students)
+
+        models = [app_main.Student, app_main.Lesson, app_main.Group, app_main.Teacher, app_main.Mark, app_main.Course,
+                  app_main.Curator, app_main.Degree, app_main.Position]
+        for name, view_class, engine in (("stock", ModelView, database.engine), ("scalable", ScalableModelView, database.admin_engine())):
+            app = build(view_class, engine, models, app_main.app)
+            for page, result in asyncio.run(page_timings(app, engine, args.runs)).items():
+                print(json.dumps({"view": name, "page": page, **result}, ensure_ascii=False))
+            under_load = asyncio.run(api_under_admin(app, args.students, args.seconds, 4, 8))
+            print(json.dumps({"view": name, "api_while_admin_browses": under_load}))
+
+
+if __name__ == "__main__":
+    main()
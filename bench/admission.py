@@ -0,0 +1,87 @@
+# usage: python -m bench.admission [--reports 8] [--crud 16] [--seconds 10]
+# cheap CRUD reads (GET /students/{id}/) while other clients keep hammering the heavy reports
+# (/curator-load/, /teacher-load/, /students/avg-grades//), with ADMISSION off and on; CRUD
+# latency percentiles and what happened to the report requests
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+REPORTS = ["/curator-load/", "/teacher-load/", "/students/avg-grades//"]
+
+
+async def drive(reports, crud, seconds, students):
+    import main
+
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    latencies = []
+    outcomes = Counter()
+    stop = time.perf_counter() + seconds
+
+    async def crud_client(index):
+        rnd = random.Random(index)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            while time.perf_counter() < stop:
+                started = time.perf_counter()
+                await http.get(f"/students/{rnd.randint(1, students)}/")
+                latencies.append(time.perf_counter() - started)
+
+    async def report_client(index):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            while time.perf_counter() < stop:
+                response = await http.get(REPORTS[index % len(REPORTS)])
+                outcomes[response.status_code] += 1
+                if response.status_code == 503:
+                    await asyncio.sleep(float(response.headers["retry-after"]))
+
+    await asyncio.gather(*(crud_client(i) for i in range(crud)), *(report_client(i) for i in range(reports)))
+    latencies.sort()
+    return {
+        "crud_requests": len(latencies),
+        "crud_p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "crud_p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 1),
+        "reports": {str(status): count for status, count in sorted(outcomes.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=8)
+    parser.add_argument("--crud", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--students", type=int, default=200_000)
+    parser.add_argument("--marks", type=int, default=1_000_000)
+    parser.add_argument("--worker", action="store_true")
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(drive(args.reports, args.crud, args.seconds, args.students))))
+        return
+
+    from bench.seed import seed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "admission.db")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", CACHE_BACKEND="off")
+        subprocess.run([sys.executable, "-c", "import main"], env=env, check=True)
+        seed(path, args.marks, students=args.students, lessons=args.students)
+        for admission in ("0", "1"):
+            out = subprocess.run(
+                [sys.executable, "-m", "bench.admission", "--worker", "--reports", str(args.reports), "--crud", str(args.crud),
+                 "--seconds", str(args.seconds), "--students", str(args.students)],
+                env=dict(env, ADMISSION=admission, SCHEMA_INIT="0"), capture_output=True, text=True, check=True,
+            ).stdout
+            print(json.dumps({"admission": admission == "1", **json.loads(out)}))
+
+
+if __name__ == "__main__":
+    main()
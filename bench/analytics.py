@@ -0,0 +1,80 @@
+# usage: python -m bench.analytics [--marks 1000000] [--runs 10]
+# SQLite GROUP BY queries vs the NumPy MarkStore answering the same questions; the NumPy side
+# pays the refresh() every /analytics/ request makes, and refresh() is also timed on its own,
+# idle and right after a mark was changed with raw SQL (picked up from the change log)
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+SQL = {
+    "distribution": "SELECT mark, COUNT(*) FROM Marks m JOIN Students s ON s.id = m.student_id GROUP BY mark",
+    "stats_course": """SELECT m.course_id, COUNT(*), AVG(m.mark), AVG(m.mark * m.mark) - AVG(m.mark) * AVG(m.mark)
+        FROM Marks m JOIN Students s ON s.id = m.student_id GROUP BY m.course_id""",
+    "stats_group": """SELECT s.group_id, COUNT(*), AVG(m.mark), AVG(m.mark * m.mark) - AVG(m.mark) * AVG(m.mark)
+        FROM Marks m JOIN Students s ON s.id = m.student_id GROUP BY s.group_id""",
+    "above_group_average": """WITH student_avg AS (
+            SELECT s.id, s.group_id, AVG(m.mark) AS average FROM Marks m JOIN Students s ON m.student_id = s.id GROUP BY s.id
+        ), group_avg AS (
+            SELECT s.group_id, AVG(m.mark) AS average FROM Marks m JOIN Students s ON m.student_id = s.id GROUP BY s.group_id
+        )
+        SELECT sa.id, sa.average, ga.average FROM student_avg sa JOIN group_avg ga ON sa.group_id = ga.group_id
+        WHERE sa.average >= ga.average ORDER BY sa.group_id, sa.average DESC""",
+}
+
+
+def measure(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--marks", type=int, default=1_000_000)
+    parser.add_argument("--students", type=int, default=20_000)
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "analytics.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from sqlalchemy import text
+    from bench.seed import seed
+    import main as app_main
+
+    seed(path, args.marks, students=args.students)
+    store = app_main.mark_store
+    start = time.perf_counter()
+    store.refresh()
+    print(json.dumps({"marks": args.marks, "numpy_load_ms": round((time.perf_counter() - start) * 1000, 2)}))
+
+    numpy = {
+        "distribution": lambda: (store.refresh(), store.distribution()),
+        "stats_course": lambda: (store.refresh(), store.stats("course")),
+        "stats_group": lambda: (store.refresh(), store.stats("group")),
+        "above_group_average": lambda: (store.refresh(), store.above_group_average()),
+    }
+
+    def write_and_refresh():
+        with app_main.engine.begin() as connection:
+            connection.execute(text("UPDATE Marks SET mark = 7 - mark WHERE id = (SELECT MAX(id) FROM Marks)"))
+        store.refresh()
+
+    print(json.dumps({"refresh_idle_ms": measure(store.refresh, args.runs),
+                      "write_and_refresh_ms": measure(write_and_refresh, args.runs)}))
+    with app_main.engine.connect() as connection:
+        for name, sql in SQL.items():
+            sqlite_ms = measure(lambda: connection.execute(text(sql)).all(), args.runs)
+            numpy_ms = measure(numpy[name], args.runs)
+            print(json.dumps({"query": name, "sqlite_ms": sqlite_ms, "numpy_ms": numpy_ms,
+                              "speedup": round(sqlite_ms / numpy_ms, 1)}))
+
+
+if __name__ == "__main__":
+    main()
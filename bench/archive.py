@@ -0,0 +1,99 @@
+# usage: python -m bench.archive [--terms 4] [--marks 200000]
+# the same stream of marks, term after term, into two databases: one that keeps every mark in
+# Marks and one that runs close_term after each term; per term the live Marks rows and file
+# size, a student's marks, the full MarkStore reload and how long the close took. the change log
+# is compacted at the end of every term in both, as a deployment running compact-changes would;
+# a close must not add anything to the change log (/changes/ would report the marks as deleted),
+# and the next term's marks must not get ids the closed terms already use
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROBE_SQL = "SELECT id, course_id, mark FROM Marks WHERE student_id = ?"
+
+
+def median_ms(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 2)
+
+
+# marks go in through sqlite3 with the triggers on, the way the API would have written them
+def add_marks(path, marks, students, courses, rnd):
+    con = sqlite3.connect(path)
+    con.executemany("INSERT INTO Marks (course_id, student_id, mark) VALUES (?, ?, ?)",
+                    ((rnd.randint(1, courses), rnd.randint(1, students), rnd.randint(2, 5)) for _ in range(marks)))
+    con.commit()
+    con.close()
+
+
+def run(path, archive, args):
+    import database
+    from analytics import MarkStore
+
+    rnd = random.Random(0)
+    store = MarkStore(database.engine)
+    last_id = 0
+    for term in range(1, args.terms + 1):
+        add_marks(path, args.marks, args.students, args.courses, rnd)
+        close_ms = None
+        if archive:
+            with database.engine.connect() as connection:
+                first_id = connection.exec_driver_sql("SELECT MIN(id) FROM Marks").scalar()
+            assert first_id > last_id, f"term {term} reused mark id {first_id}, closed terms end at {last_id}"
+            seq = database.change_seq()
+            started = time.perf_counter()
+            last_id = database.close_term(f"term-{term}")["last_mark_id"]
+            close_ms = round((time.perf_counter() - started) * 1000, 1)
+            assert database.change_seq() == seq, f"close_term logged {database.change_seq() - seq} changes"
+        database.compact_changes(retention=0)
+        with database.engine.connect() as connection:
+            live = connection.exec_driver_sql("SELECT COUNT(*) FROM Marks").scalar()
+            student_ms = median_ms(lambda: connection.exec_driver_sql(PROBE_SQL, (rnd.randint(1, args.students),)).all(), args.runs)
+            reload_ms = median_ms(lambda: store.load(connection, 0, 0), 3)
+        connection = sqlite3.connect(path)
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        connection.close()
+        print(json.dumps({"archive": archive, "term": term, "live_marks": live, "db_mb": round(os.path.getsize(path) / 2**20, 1),
+                          "student_marks_ms": student_ms, "analytics_reload_ms": reload_ms, "close_term_ms": close_ms}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--terms", type=int, default=4)
+    parser.add_argument("--marks", type=int, default=200_000)
+    parser.add_argument("--students", type=int, default=2_000)
+    parser.add_argument("--courses", type=int, default=7)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--worker", choices=["keep", "archive"])
+    args = parser.parse_args()
+
+    if args.worker:
+        run(os.environ["DATABASE_URL"].removeprefix("sqlite:///"), args.worker == "archive", args)
+        return
+
+    from bench.seed import seed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("keep", "archive"):
+            path = os.path.join(tmp, f"{mode}.db")
+            env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", ARCHIVE_DIR=tmp, CACHE_BACKEND="off")
+            subprocess.run([sys.executable, "-c", "import main"], env=env, check=True)
+            seed(path, 0, students=args.students, courses=args.courses)
+            subprocess.run([sys.executable, "-m", "bench.archive", "--worker", mode, "--terms", str(args.terms),
+                            "--marks", str(args.marks), "--students", str(args.students), "--courses", str(args.courses),
+                            "--runs", str(args.runs)], env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# usage: python -m bench.bulk [--rows 2000]
+# throughput of POST /marks/ in a loop vs one POST /marks/bulk, on a scratch database
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2000)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bulk.db')}"
+    from fastapi.testclient import TestClient
+    from bench.seed import seed
+    import main as app_main
+
+    seed(os.path.join(tmp, "bulk.db"), 0)
+    client = TestClient(app_main.app)
+    rnd = random.Random(0)
+    rows = [{"course_id": rnd.randint(1, 7), "student_id": rnd.randint(1, 315), "mark": rnd.randint(2, 5)}
+            for _ in range(args.rows)]
+
+    start = time.perf_counter()
+    for row in rows:
+        client.post("/marks/", json=row).raise_for_status()
+    single = args.rows / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    client.post("/marks/bulk", json=rows).raise_for_status()
+    bulk = args.rows / (time.perf_counter() - start)
+
+    print(json.dumps({"rows": args.rows, "single_rows_per_s": round(single), "bulk_rows_per_s": round(bulk),
+                      "speedup": round(bulk / single, 1)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+# usage: python -m bench.concurrency [--readers 8] [--writers 0 2 4] [--seconds 5]
+# read/write throughput with N reader and M writer threads sharing main.engine, per DB_PROFILE
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+def run(path, readers, writers, seconds):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from sqlalchemy.exc import OperationalError
+    from sqlalchemy.orm import Session
+    from starlette.responses import Response
+    import main
+
+    stop = time.perf_counter() + seconds
+    counts = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader():
+        rnd = random.Random()
+        while time.perf_counter() < stop:
+            with Session(main.engine) as db:
+                main.read_marks(db, (0, 100), Response(), student_id=rnd.randint(1, 315))
+            with lock:
+                counts["reads"] += 1
+
+    def writer():
+        rnd = random.Random()
+        while time.perf_counter() < stop:
+            try:
+                with Session(main.engine) as db:
+                    db.add(main.Mark(course_id=rnd.randint(1, 7), student_id=rnd.randint(1, 315), mark=rnd.randint(2, 5)))
+                    db.commit()
+                key = "writes"
+            except OperationalError:
+                key = "errors"
+            with lock:
+                counts[key] += 1
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    threads += [threading.Thread(target=writer) for _ in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {key: round(value / seconds) for key, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, nargs="+", default=[0, 2, 4])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--marks", type=int, default=100_000)
+    parser.add_argument("--worker", nargs=2, type=int)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run(os.environ["BENCH_DB"], args.worker[0], args.worker[1], args.seconds)))
+        return
+
+    from sqlalchemy import create_engine
+    from bench.seed import seed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ("default", "tuned"):
+            path = os.path.join(tmp, f"{profile}.db")
+            os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+            from models import Base
+            Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+            seed(path, args.marks)
+            for writers in args.writers:
+                env = dict(os.environ, DB_PROFILE=profile, BENCH_DB=path)
+                out = subprocess.run(
+                    [sys.executable, "-m", "bench.concurrency", "--seconds", str(args.seconds),
+                     "--worker", str(args.readers), str(writers)],
+                    env=env, capture_output=True, text=True, check=True,
+                ).stdout
+                result = {"profile": profile, "readers": args.readers, "writers": writers, **json.loads(out.splitlines()[-1])}
+                print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()
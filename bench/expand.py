@@ -0,0 +1,71 @@
+# usage: python -m bench.expand
+# every ?expand= combination on read_lesson, read_student, read_teacher and read_group, in both
+# DB_MODEs: SQL statements the request runs (counted with before_cursor_execute) against the one
+# SELECT the joined eager loading promises; exits non-zero on the first mismatch
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import httpx
+
+ROUTES = {
+    "/lessons/1/": ["group", "teacher", "course"],
+    "/students/1/": ["group"],
+    "/teachers/1/": ["degree", "position"],
+    "/groups/1/": ["curator"],
+}
+# the object and every requested relation come back in the same SELECT
+EXPECTED_STATEMENTS = 1
+
+
+async def count_statements():
+    from sqlalchemy import event
+    import database
+    import main
+
+    engine = database.async_engine.sync_engine if database.DB_MODE == "async" else database.engine
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    results = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as http:
+        for path, relations in ROUTES.items():
+            for size in range(len(relations) + 1):
+                for expand in itertools.combinations(relations, size):
+                    url = f"{path}?expand={','.join(expand)}" if expand else path
+                    statements.clear()
+                    response = await http.get(url)
+                    assert response.status_code == 200, (url, response.status_code, response.text)
+                    assert set(expand) <= set(response.json()), (url, response.json())
+                    results.append({"mode": database.DB_MODE, "url": url, "statements": len(statements)})
+                    assert len(statements) == EXPECTED_STATEMENTS, (url, statements)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--worker", action="store_true")
+    args = parser.parse_args()
+
+    if args.worker:
+        for result in asyncio.run(count_statements()):
+            print(json.dumps(result))
+        return
+
+    from bench.seed import seed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "expand.db")
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", CACHE_BACKEND="off", ADMIN="off")
+        subprocess.run([sys.executable, "-c", "import main"], env=env, check=True)
+        seed(path, 100, students=50, lessons=50)
+        for mode in ("sync", "async"):
+            subprocess.run([sys.executable, "-m", "bench.expand", "--worker"], env=dict(env, DB_MODE=mode, SCHEMA_INIT="0"), check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# usage: python -m bench.harness [--marks 100000] [--requests 200] [--concurrency 1] [--out result.json]
+# drives every CRUD and QUERIES endpoint through the ASGI app in-process and writes one JSON
+# report (throughput, p50/p95/p99, peak memory) that can be diffed between commits
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+PAYLOADS = {
+    "curators": lambda rnd, n: {"name": f"Bench {rnd.random()}"},
+    # Groups.curator_id is unique, every created or updated group takes a fresh curator
+    "groups": lambda rnd, n: {"curator_id": next(n["spare_curators"]), "name_number": "B-1"},
+    "students": lambda rnd, n: {"group_id": rnd.randint(1, n["groups"]), "name": "Bench", "birthday": "2004-01-01"},
+    "courses": lambda rnd, n: {"title": f"Bench {rnd.random()}"},
+    "marks": lambda rnd, n: {"course_id": rnd.randint(1, n["courses"]), "student_id": rnd.randint(1, n["students"]),
+                             "mark": rnd.randint(2, 5)},
+    "degrees": lambda rnd, n: {"title": f"Bench {rnd.random()}"},
+    "positions": lambda rnd, n: {"title": f"Bench {rnd.random()}"},
+    "teachers": lambda rnd, n: {"degree_id": rnd.randint(1, n["degrees"]), "position_id": rnd.randint(1, n["positions"]),
+                                "name": "Bench"},
+    "lessons": lambda rnd, n: {"group_id": rnd.randint(1, n["groups"]), "teacher_id": rnd.randint(1, n["teachers"]),
+                               "course_id": rnd.randint(1, n["courses"]),
+                               # spread out, so writes are not turned away as double bookings
+                               "time": (datetime(2025, 1, 6, 9) + timedelta(minutes=rnd.randrange(0, 10**6, 5))).isoformat()},
+}
+
+QUERIES = {
+    "GET /students/avg-grades//": lambda rnd, n: "/students/avg-grades//",
+    "GET /groups/{id}/above-average/": lambda rnd, n: f"/groups/{rnd.randint(1, n['groups'])}/above-average/",
+    "GET /schedule/{group_id}/": lambda rnd, n: f"/schedule/{rnd.randint(1, n['groups'])}/",
+    "GET /schedule/{group_id}/week/{start}/": lambda rnd, n: f"/schedule/{rnd.randint(1, n['groups'])}/week/2024-09-02/",
+    "GET /schedule/teacher/{id}/": lambda rnd, n: f"/schedule/teacher/{rnd.randint(1, n['teachers'])}/",
+    "GET /schedule/teacher/{id}/week/{start}/": lambda rnd, n: f"/schedule/teacher/{rnd.randint(1, n['teachers'])}/week/2024-09-02/",
+    "GET /teacher-load/": lambda rnd, n: "/teacher-load/",
+    "GET /curator-load/": lambda rnd, n: "/curator-load/",
+    "GET /teacher-info/": lambda rnd, n: "/teacher-info/",
+    "GET /analytics/distribution/": lambda rnd, n: "/analytics/distribution/",
+    "GET /analytics/stats/{by}/": lambda rnd, n: f"/analytics/stats/{rnd.choice(['student', 'course', 'group'])}/",
+    "GET /analytics/above-group-average/": lambda rnd, n: "/analytics/above-group-average/",
+    # one group page worth of students in a single multi-get
+    "GET /students/?ids=": lambda rnd, n: "/students/?ids=" + ",".join(str(rnd.randint(1, n["students"])) for _ in range(30)),
+}
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+async def run_scenario(client, requests, concurrency, make_request):
+    timings = []
+    queue = list(range(requests))
+
+    async def worker():
+        while queue:
+            i = queue.pop()
+            method, path, body = make_request(i)
+            start = time.perf_counter()
+            response = await client.request(method, path, json=body)
+            timings.append(time.perf_counter() - start)
+            if response.status_code >= 500:
+                raise RuntimeError(f"{method} {path}: {response.status_code}")
+
+    rss_before = peak_rss_mb()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    timings.sort()
+    return {
+        "requests": requests,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(timings) * 1000, 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95)] * 1000, 3),
+        "p99_ms": round(timings[int(len(timings) * 0.99)] * 1000, 3),
+        "peak_rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+    }
+
+
+async def run(app, counts, requests, concurrency):
+    rnd = random.Random(0)
+    report = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for table, payload in PAYLOADS.items():
+            if table == "groups":
+                spare = [(await client.post("/curators/", json={"name": "Spare"})).json()["id"] for _ in range(2 * requests)]
+                counts["spare_curators"] = iter(spare)
+            report[f"POST /{table}/"] = await run_scenario(
+                client, requests, concurrency, lambda i: ("POST", f"/{table}/", payload(rnd, counts)))
+            # only the rows created above are updated and deleted, the seeded data stays intact
+            response = await client.get(f"/{table}/", params={"after_id": counts[table], "limit": 1000})
+            created = [row["id"] for row in response.json()]
+            report[f"GET /{table}/"] = await run_scenario(
+                client, requests, concurrency, lambda i: ("GET", f"/{table}/", None))
+            report[f"GET /{table}/{{id}}/"] = await run_scenario(
+                client, requests, concurrency, lambda i: ("GET", f"/{table}/{rnd.randint(1, counts[table])}/", None))
+            report[f"PUT /{table}/{{id}}/"] = await run_scenario(
+                client, len(created), concurrency, lambda i: ("PUT", f"/{table}/{created[i]}/", payload(rnd, counts)))
+            report[f"DELETE /{table}/{{id}}/"] = await run_scenario(
+                client, len(created), concurrency, lambda i: ("DELETE", f"/{table}/{created[i]}/", None))
+        for name, path in QUERIES.items():
+            report[name] = await run_scenario(client, requests, concurrency, lambda i: ("GET", path(rnd, counts), None))
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--marks", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--db", help="existing database generated by bench.seed (default: a fresh scratch one)")
+    parser.add_argument("--out")
+    args = parser.parse_args()
+
+    path = args.db or os.path.join(tempfile.mkdtemp(), "harness.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(path)}"
+    from sqlalchemy import text
+    from bench.seed import seed
+    import main as app_main
+
+    if not args.db:
+        students = max(315, args.marks // 30)
+        seed(path, args.marks, students=students, courses=40, lessons=students // 25 * 40, teachers=max(40, students // 50))
+    with app_main.engine.connect() as connection:
+        counts = {table: connection.execute(text(f"SELECT MAX(id) FROM {table.capitalize()}")).scalar() or 1
+                  for table in PAYLOADS}
+
+    result = {
+        "commit": git_commit(),
+        "db_mode": app_main.DB_MODE,
+        "marks": counts["marks"],
+        "concurrency": args.concurrency,
+        "endpoints": asyncio.run(run(app_main.app, counts, args.requests, args.concurrency)),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+    output = json.dumps(result, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# usage: python -m bench.load [--concurrency 64] [--seconds 10]
+# serves main:app with uvicorn once per DB_MODE on the same seeded database and drives it over HTTP
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PORT = 8765
+
+
+async def drive(concurrency, seconds):
+    timings = []
+    errors = 0
+    stop = time.perf_counter() + seconds
+
+    async def worker(client):
+        nonlocal errors
+        rnd = random.Random()
+        while time.perf_counter() < stop:
+            path = rnd.choice([
+                f"/marks/{rnd.randint(1, 10000)}/",
+                f"/marks/?student_id={rnd.randint(1, 315)}",
+                f"/students/{rnd.randint(1, 315)}/",
+                f"/schedule/{rnd.randint(1, 12)}/",
+                "/teacher-info/",
+            ])
+            start = time.perf_counter()
+            response = await client.get(path)
+            timings.append(time.perf_counter() - start)
+            errors += response.status_code >= 500
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=httpx.Limits(max_connections=concurrency)) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    timings.sort()
+    return {
+        "rps": round(len(timings) / seconds),
+        "p50_ms": round(statistics.median(timings) * 1000, 2),
+        "p99_ms": round(timings[int(len(timings) * 0.99)] * 1000, 2),
+        "errors": errors,
+    }
+
+
+def wait_ready():
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/")
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--marks", type=int, default=10000)
+    args = parser.parse_args()
+
+    from sqlalchemy import create_engine
+    from bench.seed import seed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "load.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        from models import Base
+        Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+        seed(path, args.marks)
+        for mode in ("sync", "async"):
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--log-level", "warning"],
+                env=dict(os.environ, DB_MODE=mode), stderr=subprocess.DEVNULL,
+            )
+            try:
+                wait_ready()
+                print(json.dumps({"mode": mode, "concurrency": args.concurrency, **asyncio.run(drive(args.concurrency, args.seconds))}))
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# usage: python -m bench.pagination [--sizes 10000 100000 1000000] [--runs 50]
+# compares the old full-table GET /marks/ (query().all() + List[MarkResponse]) with one keyset page
+import argparse
+import json
+import os
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def run(path, mode, runs):
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy.orm import Session
+    from starlette.responses import Response
+    from typing import List
+    import main
+
+    adapter = TypeAdapter(List[main.MarkResponse])
+    timings = []
+    with Session(main.engine) as db:
+        for _ in range(runs):
+            start = time.perf_counter()
+            if mode == "old":
+                rows = db.query(main.Mark).all()
+            else:
+                rows = main.read_marks(db, (0, 100), Response())
+            json.dumps(jsonable_encoder(adapter.validate_python(rows, from_attributes=True)))
+            timings.append(time.perf_counter() - start)
+            db.expunge_all()
+    timings.sort()
+    return {
+        "p50_ms": round(statistics.median(timings) * 1000, 3),
+        "p99_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000, 3),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--worker", nargs=2)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run(args.worker[0], args.worker[1], args.runs)))
+        return
+
+    from sqlalchemy import create_engine
+    from bench.seed import seed
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            path = os.path.join(tmp, f"marks_{size}.db")
+            os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+            from models import Base
+            Base.metadata.create_all(create_engine(f"sqlite:///{path}"))
+            seed(path, size)
+            for mode in ("old", "keyset"):
+                # separate process per measurement so ru_maxrss is not shared between paths
+                runs = max(3, args.runs // 10) if mode == "old" and size >= 1_000_000 else args.runs
+                out = subprocess.run([sys.executable, "-m", "bench.pagination", "--runs", str(runs), "--worker", path, mode],
+                                     capture_output=True, text=True, check=True).stdout
+                results.append({"marks": size, "path": mode, **json.loads(out.splitlines()[-1])})
+                print(json.dumps(results[-1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+# usage: python -m bench.schedule [--lessons 100000] [--runs 200]
+# GET /schedule/{group_id}/ latency: the old 4-way join ordered by Lesson.time vs the materialized timetable
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+
+def measure(func, runs):
+    timings = []
+    rnd = random.Random(0)
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(rnd.randint(1, 12))
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return {"p50_ms": round(statistics.median(timings) * 1000, 3),
+            "p99_ms": round(timings[int(len(timings) * 0.99)] * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lessons", type=int, default=100_000)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "schedule.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from sqlalchemy.orm import Session
+    from bench.seed import seed
+    import main as app_main
+    from main import Course, Group, Lesson, Teacher
+
+    seed(path, 0, lessons=args.lessons)
+    with Session(app_main.engine) as db:
+        def joined(group_id):
+            return db.query(
+                Lesson.time.label("lesson_time"),
+                Group.name_number.label("group_name"),
+                Course.title.label("course"),
+                Teacher.name.label("teacher"),
+            ).join(Group, Lesson.group_id == Group.id).join(Course, Lesson.course_id == Course.id).join(
+                Teacher, Lesson.teacher_id == Teacher.id
+            ).where(Group.id == group_id).order_by(Lesson.time).all()
+
+        def materialized(group_id):
+            return app_main.schedule_query(db, group_id).all()
+
+        assert joined(1) == materialized(1)
+        for name, func in (("join", joined), ("materialized", materialized)):
+            print(json.dumps({"lessons": args.lessons, "path": name, **measure(func, args.runs)}))
+
+
+if __name__ == "__main__":
+    main()
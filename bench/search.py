@@ -0,0 +1,56 @@
+# usage: python -m bench.search [--students 1000000] [--runs 20]
+# GET /search/ (FTS5 prefix match, bm25 ranked) against the LIKE '%q%' scan front-ends would
+# otherwise need, on one seeded database; median milliseconds per query and rows found
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+QUERIES = ["ив", "иванов", "алекс", "петрова анна", "соловьёв", "ЗАЙЦЕВ Тимофей", "nobody"]
+
+
+def median_ms(func, runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        rows = func()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1000, 3), len(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--students", type=int, default=1_000_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--db", help="existing database generated by bench.seed (default: a fresh scratch one)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.db or os.path.join(tmp, "search.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(path)}"
+        os.environ["CACHE_BACKEND"] = "off"
+        import main
+        from sqlalchemy import text
+        from sqlalchemy.orm import Session
+
+        if not args.db:
+            from bench.seed import seed
+            seed(path, 0, students=args.students)
+
+        with Session(main.engine) as db:
+            for q in QUERIES:
+                fts_ms, fts_rows = median_ms(lambda: main.search_query(db, main.match_query(q), list(main.SEARCH_TABLES), args.limit), args.runs)
+                # LIKE is only case-insensitive for ASCII in SQLite, so Cyrillic input needs the exact case
+                like = text("SELECT 'student', id, name FROM Students WHERE name LIKE :pattern "
+                            "UNION ALL SELECT 'teacher', id, name FROM Teachers WHERE name LIKE :pattern "
+                            "UNION ALL SELECT 'curator', id, name FROM Curators WHERE name LIKE :pattern LIMIT :limit")
+                like_ms, like_rows = median_ms(lambda: db.execute(like, {"pattern": f"%{q}%", "limit": args.limit}).all(), args.runs)
+                print(json.dumps({"q": q, "fts_ms": fts_ms, "fts_rows": fts_rows, "like_ms": like_ms, "like_rows": like_rows},
+                                 ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
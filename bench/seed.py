@@ -0,0 +1,111 @@
+# usage: python -m bench.seed University.db --marks 10000000 [--seed 0]
+# seeded, referentially consistent data for all nine tables:
+# Curators -> Groups -> Students -> Marks, Degrees/Positions -> Teachers -> Lessons
+import argparse
+import json
+import os
+import random
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+from itertools import islice
+
+BATCH = 100_000
+
+LAST_NAMES = ["Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков",
+              "Фёдоров", "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов", "Козлов",
+              "Степанов", "Николаев", "Орлов", "Андреев", "Макаров", "Никитин", "Захаров", "Зайцев", "Соловьёв"]
+MALE_NAMES = ["Александр", "Дмитрий", "Максим", "Сергей", "Андрей", "Алексей", "Артём", "Илья", "Кирилл", "Михаил",
+              "Никита", "Матвей", "Роман", "Егор", "Арсений", "Иван", "Денис", "Евгений", "Тимофей", "Владимир"]
+FEMALE_NAMES = ["Анастасия", "Мария", "Анна", "Виктория", "Екатерина", "Наталья", "Марина", "Полина", "София",
+                "Дарья", "Алиса", "Ксения", "Александра", "Елена", "Ольга", "Татьяна", "Ирина", "Юлия", "Вероника"]
+COURSE_NAMES = ["Математический анализ", "Линейная алгебра", "Базы данных", "Программирование", "Физика",
+                "Дискретная математика", "Операционные системы", "Компьютерные сети", "Теория вероятностей",
+                "Английский язык", "История", "Философия", "Экономика", "Алгоритмы и структуры данных"]
+DEGREES = ["Без степени", "Кандидат наук", "Доктор наук"]
+POSITIONS = ["Ассистент", "Старший преподаватель", "Доцент", "Профессор", "Заведующий кафедрой"]
+
+
+def person(rnd):
+    last = rnd.choice(LAST_NAMES)
+    if rnd.random() < 0.5:
+        return f"{last}а {rnd.choice(FEMALE_NAMES)}"
+    return f"{last} {rnd.choice(MALE_NAMES)}"
+
+
+def insert(cur, sql, rows):
+    rows = iter(rows)
+    while batch := list(islice(rows, BATCH)):
+        cur.executemany(sql, batch)
+
+
+def seed(path, marks, students=315, courses=7, lessons=0, teachers=40, seed=0):
+    rnd = random.Random(seed)
+    groups = max(1, students // 25)
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA synchronous = OFF")
+    cur = con.cursor()
+    # the derived-table triggers would run per row; they are dropped for the load
+    # and the derived tables rebuilt in one pass afterwards
+    triggers = cur.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    for name, _ in triggers:
+        cur.execute(f"DROP TRIGGER {name}")
+
+    insert(cur, "INSERT INTO Curators (name) VALUES (?)", ((person(rnd),) for _ in range(groups)))
+    insert(cur, "INSERT INTO Groups (curator_id, name_number) VALUES (?, ?)",
+           ((i + 1, f"G-{i + 1}") for i in range(groups)))
+    insert(cur, "INSERT INTO Students (group_id, name, birthday) VALUES (?, ?, ?)",
+           ((i % groups + 1, person(rnd), (date(2000, 1, 1) + timedelta(days=rnd.randrange(2500))).isoformat())
+            for i in range(students)))
+    insert(cur, "INSERT INTO Courses (title) VALUES (?)",
+           ((COURSE_NAMES[i] if i < len(COURSE_NAMES) else f"{COURSE_NAMES[i % len(COURSE_NAMES)]} {i // len(COURSE_NAMES) + 1}",)
+            for i in range(courses)))
+    insert(cur, "INSERT INTO Degrees (title) VALUES (?)", ((title,) for title in DEGREES))
+    insert(cur, "INSERT INTO Positions (title) VALUES (?)", ((title,) for title in POSITIONS))
+    insert(cur, "INSERT INTO Teachers (degree_id, position_id, name) VALUES (?, ?, ?)",
+           ((rnd.randint(1, len(DEGREES)), rnd.randint(1, len(POSITIONS)), person(rnd)) for _ in range(teachers)))
+    start = datetime(2024, 9, 2, 9, 0)
+    insert(cur, "INSERT INTO Lessons (group_id, teacher_id, course_id, time) VALUES (?, ?, ?, ?)",
+           ((rnd.randint(1, groups), rnd.randint(1, teachers), rnd.randint(1, courses),
+             (start + timedelta(days=rnd.randrange(120), hours=rnd.randrange(8))).isoformat())
+            for _ in range(lessons)))
+    insert(cur, "INSERT INTO Marks (course_id, student_id, mark) VALUES (?, ?, ?)",
+           ((rnd.randint(1, courses), rnd.randint(1, students), rnd.randint(2, 5)) for _ in range(marks)))
+
+    for _, sql in triggers:
+        cur.execute(sql)
+    if triggers:
+        from models import REBUILD_GRADES, REBUILD_SCHEDULE, REBUILD_SEARCH, SNAPSHOT_CHANGES
+        for sql in REBUILD_GRADES + REBUILD_SCHEDULE + REBUILD_SEARCH + SNAPSHOT_CHANGES:
+            cur.execute(sql)
+    con.commit()
+    con.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path")
+    parser.add_argument("--marks", type=int, default=1_000_000)
+    parser.add_argument("--students", type=int)
+    parser.add_argument("--courses", type=int, default=40)
+    parser.add_argument("--teachers", type=int)
+    parser.add_argument("--lessons", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    students = args.students or max(315, args.marks // 30)
+    teachers = args.teachers or max(40, students // 50)
+    lessons = args.lessons if args.lessons is not None else max(1000, students // 25 * 40)
+
+    # importing main creates the schema, indexes and triggers for this file
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.path)}"
+    import main as app_main  # noqa: F401
+
+    started = time.perf_counter()
+    seed(args.path, args.marks, students=students, courses=args.courses, lessons=lessons, teachers=teachers, seed=args.seed)
+    print(json.dumps({"path": args.path, "marks": args.marks, "students": students, "teachers": teachers,
+                      "lessons": lessons, "seconds": round(time.perf_counter() - started, 1)}))
+
+
+if __name__ == "__main__":
+    main()
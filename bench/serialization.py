@@ -0,0 +1,76 @@
+# usage: python -m bench.serialization [--rows 10000] [--runs 20]
+# per model, cost of turning 10k rows into a JSON body: ORM entities + List[XResponse] validation +
+# jsonable_encoder + json.dumps (what FastAPI does for response_model) against the FAST_JSON path
+# (column tuples + encode_rows); SQL time is reported separately
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from typing import List
+
+
+def median_ms(func, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "serialization.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import TypeAdapter
+    from sqlalchemy.orm import Session
+    from bench.seed import seed
+    import main
+
+    seed(path, args.rows, students=args.rows, courses=40, lessons=args.rows, teachers=args.rows)
+    responses = {
+        main.Curator: main.CuratorResponse, main.Group: main.GroupResponse, main.Student: main.StudentResponse,
+        main.Course: main.CourseResponse, main.Mark: main.MarkResponse, main.Degree: main.DegreeResponse,
+        main.Position: main.PositionResponse, main.Teacher: main.TeacherResponse, main.Lesson: main.LessonResponse,
+    }
+    with Session(main.engine) as db:
+        for model, response_model in responses.items():
+            adapter = TypeAdapter(List[response_model])
+            columns = model.__table__.columns
+            # small dictionary tables are repeated up to --rows for the encoding timings
+            entities = db.query(model).limit(args.rows).all()
+            tuples = db.query(*columns).limit(args.rows).all()
+            per_10k = 10_000 / max(1, len(tuples))
+            repeat = -(-args.rows // max(1, len(tuples)))
+            entities = (entities * repeat)[:args.rows]
+            encoded = (tuples * repeat)[:args.rows]
+
+            def load_entities():
+                db.expunge_all()
+                db.query(model).limit(args.rows).all()
+
+            pydantic_ms = median_ms(
+                lambda: json.dumps(jsonable_encoder(adapter.validate_python(entities, from_attributes=True)),
+                                   ensure_ascii=False, separators=(",", ":")), args.runs) * 10_000 / len(encoded)
+            fast_ms = median_ms(lambda: main.encode_rows(columns.keys(), encoded), args.runs) * 10_000 / len(encoded)
+            print(json.dumps({
+                "model": model.__name__,
+                "rows": len(tuples),
+                "orm_fetch_ms_per_10k": round(median_ms(load_entities, args.runs) * per_10k, 2),
+                "tuple_fetch_ms_per_10k": round(median_ms(lambda: db.query(*columns).limit(args.rows).all(), args.runs) * per_10k, 2),
+                "pydantic_ms_per_10k": round(pydantic_ms, 2),
+                "fast_ms_per_10k": round(fast_ms, 2),
+                "speedup": round(pydantic_ms / fast_ms, 1),
+                "encoder": "orjson" if main.orjson else "json",
+            }))
+
+
+if __name__ == "__main__":
+    main()
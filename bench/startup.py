@@ -0,0 +1,63 @@
+# usage: python -m bench.startup [--runs 5]
+# import time and RSS of `import main` in a fresh interpreter per configuration, plus the slowest
+# imports of main from `python -X importtime`
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+CONFIGS = {
+    "dev (schema init, lazy admin)": {},
+    "api worker (SCHEMA_INIT=0, lazy admin)": {"SCHEMA_INIT": "0"},
+    "api worker (SCHEMA_INIT=0, ADMIN=off)": {"SCHEMA_INIT": "0", "ADMIN": "off"},
+    "admin worker (SCHEMA_INIT=0, ADMIN=on)": {"SCHEMA_INIT": "0", "ADMIN": "on"},
+}
+
+PROBE = (
+    "import time, resource; started = time.perf_counter(); import main; "
+    "print(time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)"
+)
+
+
+def measure(env, runs):
+    seconds, rss = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, check=True).stdout
+        elapsed, peak = map(float, out.split()[-2:])
+        seconds.append(elapsed)
+        rss.append(peak)
+    return statistics.median(seconds), statistics.median(rss)
+
+
+def slowest_imports(env, count=8):
+    err = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], env=env, capture_output=True, text=True).stderr
+    top = []
+    for line in err.splitlines():
+        parts = line.split("|")
+        # modules imported directly by main: the name column is indented two spaces per nesting level
+        if len(parts) == 3 and parts[1].strip().isdigit() and parts[2].startswith("   ") and not parts[2].startswith("    "):
+            top.append((int(parts[1]), parts[2].strip()))
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for us, name in sorted(top, reverse=True)[:count]]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'startup.db')}")
+        # the schema exists before the measured runs, as it does for workers started by `serve`
+        subprocess.run([sys.executable, "-c", "import main"], env=env, check=True, capture_output=True)
+        for name, overrides in CONFIGS.items():
+            config_env = dict(env, **overrides)
+            seconds, rss = measure(config_env, args.runs)
+            print(json.dumps({"config": name, "import_ms": round(seconds * 1000, 1), "peak_rss_mb": round(rss, 1),
+                              "slowest_imports": slowest_imports(config_env)}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
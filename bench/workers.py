@@ -0,0 +1,58 @@
+# usage: python -m bench.workers [--workers 1 2 4 8] [--concurrency 64] [--seconds 10]
+# starts `python main.py serve --workers N` on one seeded database and reports the time until every
+# worker finished its startup (schema init, warmup) and the requests/sec of the bench.load mix
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.load import PORT, drive
+
+
+def start(workers, env):
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "main.py", "serve", "--workers", str(workers), "--port", str(PORT)],
+        env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    ready = 0
+    for line in server.stdout:
+        ready += "Application startup complete" in line
+        if ready == workers:
+            return server, time.perf_counter() - started
+    raise RuntimeError("server exited during startup")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--marks", type=int, default=10000)
+    args = parser.parse_args()
+
+    from bench.seed import seed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "workers.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+        import main as app_main  # noqa: F401
+        seed(path, args.marks)
+        # no response cache, so every request reaches a worker's handler and the database
+        env = dict(os.environ, CACHE_BACKEND="off")
+        for workers in args.workers:
+            server, startup = start(workers, env)
+            try:
+                result = asyncio.run(drive(args.concurrency, args.seconds))
+                print(json.dumps({"workers": workers, "cores": os.cpu_count(), "startup_s": round(startup, 2), **result}))
+            finally:
+                server.terminate()
+                server.wait()
+
+
+if __name__ == "__main__":
+    main()
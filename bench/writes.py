@@ -0,0 +1,74 @@
+# usage: python -m bench.writes [--concurrency 64] [--seconds 5]
+# POST /marks/ throughput through the ASGI app with the write queue off and on, per DB_PROFILE;
+# one mark in a hundred is out of range, and exactly those requests have to fail
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+
+async def drive(concurrency, seconds, invalid):
+    import main
+
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    counts = {"ok": 0, "failed": 0, "failed_invalid": 0}
+    stop = time.perf_counter() + seconds
+
+    async def client(index):
+        rnd = random.Random(index)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            while time.perf_counter() < stop:
+                bad = rnd.random() < invalid
+                payload = {"course_id": rnd.randint(1, 7), "student_id": rnd.randint(1, 315), "mark": 7 if bad else rnd.randint(2, 5)}
+                response = await http.post("/marks/", json=payload)
+                if response.status_code == 200:
+                    counts["ok"] += 1
+                else:
+                    counts["failed"] += 1
+                    counts["failed_invalid"] += bad
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"writes_per_s": round(counts["ok"] / elapsed), **counts}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--invalid", type=float, default=0.01)
+    parser.add_argument("--worker", action="store_true")
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(asyncio.run(drive(args.concurrency, args.seconds, args.invalid))))
+        return
+
+    from bench.seed import seed
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ("default", "tuned"):
+            for write_queue in ("0", "1"):
+                path = os.path.join(tmp, f"{profile}-{write_queue}.db")
+                env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}", DB_PROFILE=profile, WRITE_QUEUE=write_queue,
+                           CACHE_BACKEND="off")
+                subprocess.run([sys.executable, "-c", "import main"], env=env, check=True)
+                seed(path, 10_000)
+                out = subprocess.run(
+                    [sys.executable, "-m", "bench.writes", "--worker", "--concurrency", str(args.concurrency),
+                     "--seconds", str(args.seconds), "--invalid", str(args.invalid)],
+                    env=env, capture_output=True, text=True, check=True,
+                ).stdout
+                print(json.dumps({"profile": profile, "write_queue": write_queue == "1", **json.loads(out)}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict
+
+from fastapi.routing import APIRoute
+from starlette.responses import Response
+
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_TTL = float(os.environ.get("CACHE_TTL", 300))
+CACHE_SIZE = int(os.environ.get("CACHE_SIZE", 1024))
+REDIS_URL = os.environ.get("REDIS_URL", "redis://localhost:6379/0")
+
+# headers worth replaying from a cached response; content-length is recomputed
+CACHED_HEADERS = ("content-type", "x-next-cursor")
+
+
+class MemoryBackend:
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.tags = defaultdict(set)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, tags, value = entry
+            if expires < time.monotonic():
+                self._drop(key)
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags):
+        evicted = 0
+        with self.lock:
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (time.monotonic() + self.ttl, tags, value)
+            for tag in tags:
+                self.tags[tag].add(key)
+            while len(self.entries) > self.size:
+                self._drop(next(iter(self.entries)))
+                evicted += 1
+        return evicted
+
+    def invalidate(self, tags):
+        with self.lock:
+            keys = set().union(*(self.tags.pop(tag, set()) for tag in tags))
+            for key in keys:
+                self._drop(key)
+        return len(keys)
+
+    # one process: the generations kept by ResponseCache are all there is
+    def generation(self, tags):
+        return ()
+
+    def _drop(self, key):
+        _, tags, _ = self.entries.pop(key)
+        for tag in tags:
+            self.tags[tag].discard(key)
+
+
+# shared between workers; redis applies the TTL and its own maxmemory eviction,
+# tag sets map a table name to the cache keys built from it
+class RedisBackend:
+    def __init__(self, url, ttl):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        value = self.client.get(f"cache:{key}")
+        return None if value is None else pickle.loads(value)
+
+    def set(self, key, value, tags):
+        pipe = self.client.pipeline()
+        pipe.set(f"cache:{key}", pickle.dumps(value), ex=int(self.ttl))
+        for tag in tags:
+            pipe.sadd(f"tag:{tag}", key)
+        pipe.execute()
+        return 0
+
+    # bumped by every worker's invalidation, so a response read in one worker before another
+    # worker's commit is not stored after it
+    def generation(self, tags):
+        return tuple(self.client.mget([f"gen:{tag}" for tag in sorted(tags)]))
+
+    def invalidate(self, tags):
+        pipe = self.client.pipeline()
+        for tag in tags:
+            pipe.incr(f"gen:{tag}")
+            pipe.smembers(f"tag:{tag}")
+            pipe.delete(f"tag:{tag}")
+        keys = set().union(*pipe.execute()[1::3])
+        if keys:
+            self.client.delete(*(f"cache:{key.decode()}" for key in keys))
+        return len(keys)
+
+
+# every invalidation bumps a generation per tag; a response is stored only if none of its
+# tags moved while it was built, so a read racing a commit cannot outlive the invalidation
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+        self.generations = Counter()
+        self.lock = threading.Lock()
+
+    def generation(self, tags):
+        with self.lock:
+            return self._generation(tags)
+
+    def _generation(self, tags):
+        local = tuple(self.generations[tag] for tag in sorted(tags))
+        return local + (self.backend.generation(tags) if self.backend else ())
+
+    def get(self, key):
+        value = self.backend.get(key) if self.backend else None
+        self.stats["hits" if value is not None else "misses"] += 1
+        return value
+
+    def set(self, key, value, tags, generation=None):
+        if not self.backend:
+            return
+        with self.lock:
+            if generation is not None and generation != self._generation(tags):
+                return
+            self.stats["evictions"] += self.backend.set(key, value, tags)
+
+    def invalidate(self, tags):
+        if not tags:
+            return
+        with self.lock:
+            self.generations.update(tags)
+        if self.backend:
+            self.stats["invalidations"] += self.backend.invalidate(tags)
+
+
+def make_backend():
+    if CACHE_BACKEND == "redis":
+        return RedisBackend(REDIS_URL, CACHE_TTL)
+    if CACHE_BACKEND == "memory":
+        return MemoryBackend(CACHE_SIZE, CACHE_TTL)
+    return None
+
+
+response_cache = ResponseCache(make_backend())
+
+
+def cached(*models):
+    def wrap(func):
+        func.cache_tags = frozenset(model.__tablename__ for model in models)
+        return func
+    return wrap
+
+
+def not_modified(request, etag):
+    return etag in request.headers.get("if-none-match", "")
+
+
+# GET routes whose endpoint carries cache_tags are served from response_cache as
+# pre-encoded bytes with an ETag; invalidation happens per table on commit
+class CachedRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        tags = getattr(self.endpoint, "cache_tags", None)
+        if not tags:
+            return handler
+
+        async def cached_handler(request):
+            if request.method != "GET":
+                return await handler(request)
+            key = f"{request.url.path}?{request.url.query}"
+            entry = response_cache.get(key)
+            if entry is None:
+                generation = response_cache.generation(tags)
+                response = await handler(request)
+                if response.status_code != 200 or not hasattr(response, "body") or getattr(request.state, "uncacheable", False):
+                    return response
+                headers = {name: response.headers[name] for name in CACHED_HEADERS if name in response.headers}
+                entry = ('"' + hashlib.blake2b(response.body, digest_size=16).hexdigest() + '"', headers, response.body)
+                response_cache.set(key, entry, tags, generation)
+            etag, headers, body = entry
+            if not_modified(request, etag):
+                return Response(status_code=304, headers={"etag": etag})
+            return Response(content=body, headers={**headers, "etag": etag})
+
+        return cached_handler
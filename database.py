@@ -0,0 +1,337 @@
+from fastapi import Depends, Request
+from fastapi.concurrency import run_in_threadpool
+from typing import Annotated
+from contextlib import contextmanager
+from urllib.parse import quote
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+from models import Base, ARCHIVE_SCHEMA, CHANGE_TRIGGERS, GRADE_TRIGGERS, MIGRATIONS, REBUILD_GRADES, REBUILD_SCHEDULE, REBUILD_SEARCH
+import admission
+import profiling
+import replicas
+import writes
+import asyncio
+import inspect
+import os
+import re
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./University.db")
+DB_PROFILE = os.environ.get("DB_PROFILE", "tuned")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+SCHEMA_INIT = os.environ.get("SCHEMA_INIT", "1") == "1"
+CHANGES_RETENTION = float(os.environ.get("CHANGES_RETENTION", 7 * 24 * 3600))
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR")
+ADMIN_POOL_SIZE = int(os.environ.get("ADMIN_POOL_SIZE", 2))
+
+# pragmas applied to every new connection; WAL lets readers run while a writer commits,
+# synchronous=NORMAL is durable across app crashes in WAL mode and only fsyncs on checkpoints
+ENGINE_PROFILES = {
+    "default": {},
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -64 * 1024,
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+# file-backed SQLite: a queue of long-lived connections, one per concurrent request,
+# so pragmas and the page cache survive between requests
+engine = create_engine(
+    DATABASE_URL,
+    connect_args={"check_same_thread": False, **profiling.connect_args()},
+    poolclass=QueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+)
+
+@event.listens_for(engine, "connect")
+def apply_profile(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in ENGINE_PROFILES[DB_PROFILE].items():
+        cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.close()
+
+if profiling.PROFILING:
+    profiling.instrument_engine(engine)
+if admission.ADMISSION:
+    admission.instrument_engine(engine)
+
+# the admin's own pool: however many admin pages are open, they hold at most ADMIN_POOL_SIZE
+# connections and never wait for (or take) the ones the API requests use
+def admin_engine():
+    admin = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=QueuePool,
+                          pool_size=ADMIN_POOL_SIZE, max_overflow=0)
+    event.listen(admin, "connect", apply_profile)
+    return admin
+
+
+def run_statements(statements):
+    with engine.begin() as connection:
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+
+def rebuild_grades():
+    run_statements(REBUILD_GRADES)
+
+# rows that dropped to count = 0 are kept by the triggers but not produced by a rebuild
+def read_grades(connection):
+    return {table: set(connection.exec_driver_sql(f"SELECT * FROM {table} WHERE count > 0")) for table in ("StudentGrades", "GroupGrades")}
+
+def verify_grades():
+    with engine.connect() as connection:
+        stored = read_grades(connection)
+        for statement in REBUILD_GRADES:
+            connection.exec_driver_sql(statement)
+        fresh = read_grades(connection)
+        connection.rollback()
+    return {table: sorted(stored[table] ^ fresh[table]) for table in stored}
+
+def rebuild_schedule():
+    run_statements(REBUILD_SCHEDULE)
+
+def rebuild_search():
+    run_statements(REBUILD_SEARCH)
+
+# compaction keeps only the newest change per row, retention then drops delete tombstones;
+# both only touch changes older than CHANGES_RETENTION, so live rows always keep one entry
+def compact_changes(retention=CHANGES_RETENTION):
+    cutoff = f"datetime('now', '-{int(retention)} seconds')"
+    with engine.begin() as connection:
+        compacted = connection.exec_driver_sql(f"""DELETE FROM Changes WHERE changed_at < {cutoff}
+            AND seq NOT IN (SELECT MAX(seq) FROM Changes GROUP BY table_name, row_id)""").rowcount
+        horizon = connection.exec_driver_sql(f"SELECT MAX(seq) FROM Changes WHERE op = 'delete' AND changed_at < {cutoff}").scalar()
+        expired = connection.exec_driver_sql(f"DELETE FROM Changes WHERE op = 'delete' AND changed_at < {cutoff}").rowcount
+        if horizon is not None:
+            connection.exec_driver_sql(
+                "INSERT INTO ChangeHorizon (id, seq) VALUES (1, ?) ON CONFLICT DO UPDATE SET seq = MAX(seq, excluded.seq)", (horizon,))
+    return {"compacted": compacted, "expired": expired}
+
+def archive_path(term):
+    directory = ARCHIVE_DIR or os.path.dirname(os.path.abspath(engine.url.database))
+    base = os.path.splitext(os.path.basename(engine.url.database))[0]
+    return os.path.join(directory, f"{base}.term-{term}.db")
+
+# the delete triggers held back while a term's marks leave Marks: the grades keep counting them and
+# the change log does not tell consumers (or the other workers) that they were deleted
+ARCHIVE_HELD_TRIGGERS = {name: next(trigger for trigger in GRADE_TRIGGERS + CHANGE_TRIGGERS if f" {name} " in trigger)
+                         for name in ("marks_grades_delete", "marks_changes_delete")}
+
+# 1. every mark is copied into <db>.term-<name>.db in one read snapshot and that file is finished
+#    on its own: in WAL mode a transaction spanning attached files is not atomic across them
+# 2. one transaction on the live file records the term, folds the marks into ArchivedMarks and deletes
+#    them with the grades and change log delete triggers held back, so StudentGrades/GroupGrades keep
+#    counting them and /changes/ does not report them as deleted; the new Terms row is the signal;
+#    a mark of the term changed in between (seen in the change log) fails the close instead of being lost.
+def close_term(name):
+    if not re.fullmatch(r"[A-Za-z0-9_-]+", name):
+        raise ValueError("a term name is made of letters, digits, _ and -")
+    path = archive_path(name)
+    partial = f"{path}.partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    with engine.connect() as connection:
+        if connection.exec_driver_sql("SELECT 1 FROM Terms WHERE name = ?", (name,)).first():
+            raise ValueError(f"term {name} is already closed")
+        connection.exec_driver_sql("ATTACH DATABASE ? AS archive", (partial,))
+        try:
+            for statement in ARCHIVE_SCHEMA:
+                connection.exec_driver_sql(statement.format(schema="archive"))
+            connection.exec_driver_sql("INSERT INTO archive.Marks SELECT id, course_id, student_id, mark FROM main.Marks")
+            last_id, marks, seq = connection.exec_driver_sql(
+                "SELECT COALESCE(MAX(id), 0), COUNT(*), (SELECT COALESCE(MAX(seq), 0) FROM main.Changes) FROM archive.Marks").one()
+            connection.commit()
+        finally:
+            connection.exec_driver_sql("DETACH DATABASE archive")
+    if not marks:
+        os.remove(partial)
+        raise ValueError("there are no marks to archive")
+    os.replace(partial, path)
+
+    with engine.begin() as connection:
+        connection.exec_driver_sql("INSERT INTO Terms (name, path, last_mark_id, marks) VALUES (?, ?, ?, ?)", (name, path, last_id, marks))
+        if connection.exec_driver_sql("SELECT 1 FROM Changes WHERE seq > ? AND table_name = 'Marks' AND row_id <= ? LIMIT 1", (seq, last_id)).first():
+            raise RuntimeError(f"marks of term {name} changed while it was archived, close it again")
+        connection.exec_driver_sql("""INSERT INTO ArchivedMarks (student_id, course_id, mark, count)
+            SELECT student_id, course_id, mark, COUNT(*) FROM Marks WHERE id <= ? AND mark IS NOT NULL GROUP BY student_id, course_id, mark
+            ON CONFLICT DO UPDATE SET count = count + excluded.count""", (last_id,))
+        for trigger in ARCHIVE_HELD_TRIGGERS:
+            connection.exec_driver_sql(f"DROP TRIGGER {trigger}")
+        connection.exec_driver_sql("DELETE FROM Marks WHERE id <= ?", (last_id,))
+        for trigger in ARCHIVE_HELD_TRIGGERS.values():
+            connection.exec_driver_sql(trigger)
+    return {"term": name, "path": path, "marks": marks, "last_mark_id": last_id}
+
+# a closed term's file is ATTACHed read-only as `term` to the session's connection for one query
+@contextmanager
+def attached_term(db, term):
+    connection = db.connection()
+    connection.exec_driver_sql("ATTACH DATABASE ? AS term", (f"file:{quote(term.path)}?mode=ro",))
+    try:
+        yield
+    finally:
+        connection.exec_driver_sql("DETACH DATABASE term")
+
+# create_all skips indexes of tables that already exist, so older University.db files get them here,
+# one CREATE INDEX IF NOT EXISTS per transaction to keep the write lock short
+def create_indexes():
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def migrate():
+    with engine.begin() as connection:
+        version = connection.exec_driver_sql("PRAGMA user_version").scalar()
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            for statement in migration["statements"]:
+                connection.exec_driver_sql(statement)
+            for problem, query in migration["checks"].items():
+                ids = connection.exec_driver_sql(query).scalars().all()
+                if ids:
+                    raise RuntimeError(f"migration {number}: {len(ids)} {problem}, fix them and restart (ids {ids[:20]})")
+            connection.exec_driver_sql(f"PRAGMA user_version = {number}")
+
+def init_schema():
+    Base.metadata.create_all(bind = engine)
+    create_indexes()
+    migrate()
+
+
+# ---------------------------------------- REPLICAS ----------------------------------------
+# report routes marked @replica_read are served from a replica engine: snapshot copies of the
+# primary file (REPLICA_MODE=snapshot), read-only connections to it (ro) or REPLICA_URLS;
+# writes and everything else stay on the primary engine
+
+def apply_replica_profile(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for pragma, value in ENGINE_PROFILES[DB_PROFILE].items():
+        if pragma not in replicas.READ_ONLY_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+    cursor.execute("PRAGMA query_only = 1")
+    cursor.close()
+
+def replica_engine(url):
+    if DB_MODE == "async":
+        from sqlalchemy.ext.asyncio import create_async_engine
+
+        replica = create_async_engine(url.replace("sqlite://", "sqlite+aiosqlite://", 1), pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+        sync_engine = replica.sync_engine
+    else:
+        replica = create_engine(url, connect_args={"check_same_thread": False, **profiling.connect_args()},
+                                poolclass=QueuePool, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+        sync_engine = replica
+    if sync_engine.dialect.name == "sqlite":
+        event.listen(sync_engine, "connect", apply_replica_profile)
+    if profiling.PROFILING:
+        profiling.instrument_engine(sync_engine)
+    if admission.ADMISSION:
+        admission.instrument_engine(sync_engine)
+    return replica
+
+def change_seq():
+    with engine.connect() as connection:
+        return connection.exec_driver_sql("SELECT COALESCE(MAX(seq), 0) FROM Changes").scalar()
+
+# X-Consistency: primary skips the replicas, X-Min-Seq: <seq> (read-your-writes, the seq comes from
+# the X-Change-Seq header of the write) only accepts a replica that has seen it; a lagging snapshot
+# is still served within REPLICA_MAX_LAG but its response is kept out of the response cache
+def pick_replica(request):
+    if replica_set is None or not getattr(request.scope.get("endpoint"), "replica_read", False):
+        return None
+    if request.headers.get("x-consistency") == "primary":
+        return None
+    min_seq = request.headers.get("x-min-seq")
+    replica = replica_set.pick(int(min_seq) if min_seq and min_seq.isdigit() else None)
+    if replica is not None and replica.path is not None and replica.seq < change_seq():
+        request.state.uncacheable = True
+    return replica
+
+DB_MODE = os.environ.get("DB_MODE", "sync")
+
+replica_set = replicas.make_replica_set(engine.url.database, replica_engine, refresh=SCHEMA_INIT)
+
+
+# DB_MODE=async serves the routes as async def handlers on an AsyncSession (aiosqlite by default);
+# the handler bodies stay sync ORM code and run through AsyncSession.run_sync, so both modes share them
+if DB_MODE == "async":
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+    ASYNC_DATABASE_URL = os.environ.get("ASYNC_DATABASE_URL", DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1))
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+    if async_engine.dialect.name == "sqlite":
+        event.listen(async_engine.sync_engine, "connect", apply_profile)
+    if profiling.PROFILING:
+        profiling.instrument_engine(async_engine.sync_engine)
+    if admission.ADMISSION:
+        admission.instrument_engine(async_engine.sync_engine)
+
+    async def get_db(request: Request):
+        replica = await run_in_threadpool(pick_replica, request)
+        async with AsyncSession(replica.engine if replica else async_engine, expire_on_commit=False) as session:
+            yield session
+
+    dbDep = Annotated[AsyncSession, Depends(get_db)]
+else:
+    def get_db(request: Request):
+        replica = pick_replica(request)
+        with Session(replica.engine if replica else engine) as session:
+            yield session
+
+    dbDep = Annotated[Session, Depends(get_db)]
+
+def db_route(func):
+    if DB_MODE != "async":
+        return func
+
+    async def handler(**kwargs):
+        db = kwargs.pop("db")
+        return await db.run_sync(lambda session: func(db=session, **kwargs))
+
+    handler.__name__ = func.__name__
+    handler.__doc__ = func.__doc__
+    handler.__signature__ = inspect.signature(func)
+    return handler
+
+
+# ------------------------------------- WRITE QUEUE ----------------------------------------
+# WRITE_QUEUE=1: mutating CRUD handlers are run by one writer thread that commits them in batches,
+# one transaction (one fsync) per batch instead of per request. The writer has its own connection;
+# pysqlite's implicit transactions are switched off so the savepoints nest inside BEGIN IMMEDIATE
+
+def writer_engine():
+    writer = create_engine(DATABASE_URL, connect_args={"check_same_thread": False, **profiling.connect_args()},
+                           poolclass=QueuePool, pool_size=1, max_overflow=0)
+
+    @event.listens_for(writer, "connect")
+    def connect(dbapi_connection, connection_record):
+        apply_profile(dbapi_connection, connection_record)
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(writer, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    if profiling.PROFILING:
+        profiling.instrument_engine(writer)
+    return writer
+
+write_queue = writes.WriteQueue(writer_engine(), writes.WRITE_BATCH, writes.WRITE_WAIT_MS) if writes.WRITE_QUEUE else None
+
+# used instead of db_route on the create/update/delete handlers; with the queue on, the route
+# awaits its op without holding a session or a threadpool thread
+def write_route(func):
+    if write_queue is None:
+        return db_route(func)
+
+    async def handler(**kwargs):
+        return await asyncio.wrap_future(write_queue.submit(lambda session: func(db=session, **kwargs)))
+
+    signature = inspect.signature(func)
+    handler.__name__ = func.__name__
+    handler.__doc__ = func.__doc__
+    handler.__signature__ = signature.replace(parameters=[p for p in signature.parameters.values() if p.name != "db"])
+    return handler
@@ -1,110 +1,261 @@
-from fastapi import FastAPI, HTTPException, Depends
-from fastapi.responses import HTMLResponse
-from typing import Annotated, List
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, CheckConstraint, distinct, func
-from sqlalchemy.orm import declarative_base, Session, relationship
-from pydantic import BaseModel
-from starlette_admin.contrib.sqla import Admin, ModelView
+from fastapi import FastAPI, HTTPException, Depends, Body, Header, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, StreamingResponse
+from typing import Annotated, Dict, Generic, List, Literal, Optional, TypeVar, Union
+from datetime import date, datetime, timedelta
+from sqlalchemy import event, select, text, distinct, func, MetaData
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy import inspect as inspect_model
+from sqlalchemy.orm import joinedload, Session
+from sqlalchemy.orm.util import identity_key
+from pydantic import BaseModel, NaiveDatetime
+from cache import CachedRoute, cached, response_cache
+from models import (Curator, Group, Student, Course, Mark, Degree, Position, Teacher, Lesson,
+                    StudentGrade, GroupGrade, ScheduleEntry, Change, ChangeHorizon, Term, CASCADES, SEARCH_TABLES, search_table, match_query)
+from database import (engine, init_schema, create_indexes, rebuild_grades, verify_grades, rebuild_schedule, rebuild_search, compact_changes,
+                      close_term, attached_term, change_seq, replica_set, dbDep, db_route, write_route, DB_MODE, DB_POOL_SIZE, SCHEMA_INIT)
+from admin import mount_admin
+import admission
+import database
+import profiling
+import analytics
+import writes
+from replicas import replica_read
+from admission import time_budget
 import uvicorn
-
-engine = create_engine("sqlite:///./University.db", connect_args={"check_same_thread": False})
-
-Base = declarative_base()
-
-class Curator(Base):
-    __tablename__ = "Curators"
- 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    name = Column(String, nullable=False)
-
-class Group(Base):
-    __tablename__ = "Groups"
- 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    curator_id = Column(Integer, ForeignKey('Curators.id'), nullable=False, unique=True)
-    name_number = Column(String, nullable=False)
-
-    curator = relationship("Curator")
-
-class Student(Base):
-    __tablename__ = "Students"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    group_id = Column(Integer, ForeignKey('Groups.id'), nullable=False)
-    name = Column(String, nullable=False)
-    birthday = Column(String, nullable=False)
-
-    group = relationship("Group")
-
-
-class Course(Base):
-    __tablename__ = "Courses"
- 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    title = Column(String, nullable=False, unique=True)  
-
-class Mark(Base):
-    __tablename__ = "Marks"
-    __table_args__ = (
-        CheckConstraint('mark >= 2 AND mark <= 5', name='mark_range_check'),
-    )
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    course_id = Column(Integer, ForeignKey('Courses.id'), nullable=False)
-    student_id = Column(Integer, ForeignKey('Students.id', ondelete='CASCADE'), nullable=False)
-    mark = Column(Integer)
-
-    course = relationship("Course")
-    student = relationship("Student")
-
-class Degree(Base):
-    __tablename__ = "Degrees"
- 
-    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
-    title = Column(String, nullable=False, unique=True)
-
-class Position(Base):
-    __tablename__ = "Positions"
- 
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    title = Column(String, nullable=False)
-
-class Teacher(Base):
-    __tablename__ = "Teachers"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    degree_id = Column(Integer, ForeignKey('Degrees.id'), nullable=False)
-    position_id = Column(Integer, ForeignKey('Positions.id'), nullable=False)
-    name = Column(String, nullable=False)
-
-    degree = relationship("Degree")
-    position = relationship("Position")
-
-
-class Lesson(Base):
-    __tablename__ = "Lessons"
-
-    id = Column(Integer, primary_key=True, autoincrement=True)
-    group_id = Column(Integer, ForeignKey('Groups.id'), nullable=False)
-    teacher_id = Column(Integer, ForeignKey('Teachers.id', ondelete='CASCADE'), nullable=False)
-    course_id = Column(Integer, ForeignKey('Courses.id'), nullable=False)
-    time = Column(String, nullable=False)
-
-    group = relationship("Group")
-    teacher = relationship("Teacher")
-    course = relationship("Course")
-
-
-Base.metadata.create_all(bind = engine)
-
-
-def get_db():
-    with Session(engine) as session:
-        yield session
-
-dbDep = Annotated[Session, Depends(get_db)]
-
-app = FastAPI()
+import asyncio
+import base64
+import csv
+import io
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FAST_JSON = os.environ.get("FAST_JSON", "0") == "1"
+WORKERS = int(os.environ.get("WORKERS", 1))
+WARMUP = os.environ.get("WARMUP", "0") == "1"
+CHANGES_POLL = float(os.environ.get("CHANGES_POLL", 0.5))
+LESSON_LENGTH = timedelta(minutes=float(os.environ.get("LESSON_MINUTES", 90)))
+
+logger = logging.getLogger(__name__)
+
+# `python main.py serve` runs this once before forking and starts the workers with SCHEMA_INIT=0
+if SCHEMA_INIT:
+    init_schema()
+
+
+def encode_cursor(last_id):
+    return base64.urlsafe_b64encode(str(last_id).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def get_page(after_id: int = 0, cursor: Optional[str] = None, limit: Annotated[int, Query(ge=1, le=1000)] = 100):
+    if cursor is not None:
+        after_id = decode_cursor(cursor)
+    return after_id, limit
+
+pageDep = Annotated[tuple, Depends(get_page)]
+
+def parse_expand(expand, model):
+    relations = [relation for relation in (expand or "").split(",") if relation]
+    unknown = set(relations) - set(inspect_model(model).relationships.keys())
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot expand {', '.join(sorted(unknown))}")
+    return relations
+
+# requested relations come back in the same SELECT through LEFT OUTER JOINs;
+# the response is built from loaded attributes only, so nothing is lazy-loaded while serializing
+def get_expanded(db, model, object_id, relations):
+    return db.get(model, object_id, options=[joinedload(getattr(model, relation)) for relation in relations])
+
+def expanded(obj, relations):
+    data = {column.name: getattr(obj, column.name) for column in obj.__table__.columns}
+    for relation in relations:
+        data[relation] = getattr(obj, relation)
+    return data
+
+# dates and times leave the API (and the CSV export) as ISO 8601, as pydantic writes them
+def json_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+# plain column tuples encoded straight to JSON bytes: no ORM identity map, no per-row
+# pydantic validation and no jsonable_encoder; response_model still documents the schema
+def encode_rows(keys, rows):
+    objects = [dict(zip(keys, row)) for row in rows]
+    if orjson:
+        return orjson.dumps(objects)
+    return json.dumps(objects, ensure_ascii=False, separators=(",", ":"), default=json_default).encode()
+
+# keyset pagination: WHERE id > after_id ORDER BY id LIMIT n is a rowid range scan,
+# the cursor for the next page goes to the X-Next-Cursor header
+def paginate(db, model, page, response, **filters):
+    after_id, limit = page
+    filters = {column: value for column, value in filters.items() if value is not None}
+    table = getattr(model, "__table__", model)
+    columns = table.columns if FAST_JSON or model is table else [model]
+    rows = db.query(*columns).filter(table.c.id > after_id).filter_by(**filters).order_by(table.c.id).limit(limit + 1).all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].id)
+    if FAST_JSON:
+        return Response(encode_rows(columns.keys(), rows), media_type="application/json", headers=headers)
+    response.headers.update(headers)
+    return rows
+
+MULTI_GET_LIMIT = 1000
+# below the 999 bound parameters older sqlite builds allow per statement
+IN_CHUNK = 900
+
+def get_ids(ids: Optional[str] = None):
+    if ids is None:
+        return None
+    try:
+        wanted = [int(value) for value in ids.split(",") if value]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid ids")
+    if len(wanted) > MULTI_GET_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {MULTI_GET_LIMIT} ids, use POST batch-get for more")
+    return wanted
+
+idsDep = Annotated[Optional[List[int]], Depends(get_ids)]
+
+T = TypeVar("T")
+
+class Batch(BaseModel, Generic[T]):
+    items: List[Optional[T]]
+    missing: List[int]
+
+# objects already in the session identity map are reused, the rest come from one WHERE id IN (...)
+# per chunk; items follow the requested order with null where the id does not exist
+def multi_get(db, model, ids):
+    unique = list(dict.fromkeys(ids))
+    found = {}
+    for object_id in unique:
+        obj = db.identity_map.get(identity_key(model, object_id))
+        if obj is not None:
+            found[object_id] = obj
+    wanted = [object_id for object_id in unique if object_id not in found]
+    for start in range(0, len(wanted), IN_CHUNK):
+        for obj in db.scalars(select(model).where(model.id.in_(wanted[start:start + IN_CHUNK]))):
+            found[obj.id] = obj
+    return {"items": [found.get(object_id) for object_id in ids],
+            "missing": [object_id for object_id in unique if object_id not in found]}
+
+# tables written in a transaction are collected here and their cached responses dropped on commit;
+# a delete also writes the tables its cascade triggers delete from
+def cascaded(table_name):
+    return [table_name, *(child for child, column in CASCADES.get(table_name, []))]
+
+@event.listens_for(Session, "after_flush")
+def collect_flushed_tables(session, flush_context):
+    written = session.info.setdefault("written_tables", set())
+    for obj in [*session.new, *session.dirty]:
+        written.add(obj.__table__.name)
+    for obj in session.deleted:
+        written.update(cascaded(obj.__table__.name))
+
+@event.listens_for(Session, "do_orm_execute")
+def collect_executed_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table_name = orm_execute_state.statement.table.name
+        orm_execute_state.session.info.setdefault("written_tables", set()).update(
+            cascaded(table_name) if orm_execute_state.is_delete else [table_name])
+
+@event.listens_for(Session, "after_commit")
+def invalidate_written_tables(session):
+    response_cache.invalidate(session.info.pop("written_tables", None))
+
+@event.listens_for(Session, "after_rollback")
+def forget_written_tables(session):
+    session.info.pop("written_tables", None)
+
+# ---------------------------------------- STARTUP -----------------------------------------
+# uvicorn finishes the lifespan startup before a worker accepts connections
+
+def warm_pool(pool_engine):
+    connections = [pool_engine.connect() for _ in range(DB_POOL_SIZE)]
+    for connection in connections:
+        connection.exec_driver_sql("SELECT 1")
+        connection.close()
+
+# opens the whole pool (pragmas run on connect), pulls the report queries' pages into the
+# SQLite page cache and loads the analytics arrays
+def warmup():
+    warm_pool(engine)
+    for replica in replica_set.replicas if replica_set else []:
+        if DB_MODE != "async":
+            warm_pool(replica.engine)
+    with Session(engine) as db:
+        for query in advised_queries(db).values():
+            query.all()
+    mark_store.refresh()
+
+# workers share nothing, so writes made by the other workers reach this worker's response cache
+# through the change log (the analytics arrays read it themselves on refresh)
+async def follow_changes():
+    since = await run_in_threadpool(change_seq)
+    while True:
+        await asyncio.sleep(CHANGES_POLL)
+        try:
+            changes = await run_in_threadpool(read_change_log, since, 1000, None)
+        except HTTPException:
+            changes, since = [], await run_in_threadpool(change_seq)
+        if not changes:
+            continue
+        since = changes[-1]["seq"]
+        response_cache.invalidate({change["table"] for change in changes})
+
+async def warm_async_pool():
+    connections = [await database.async_engine.connect() for _ in range(DB_POOL_SIZE)]
+    for connection in connections:
+        await connection.exec_driver_sql("SELECT 1")
+        await connection.close()
+
+@asynccontextmanager
+async def lifespan(app):
+    if WARMUP:
+        started = time.perf_counter()
+        await run_in_threadpool(warmup)
+        if DB_MODE == "async":
+            await warm_async_pool()
+        logger.info("worker %d warmed up in %.2fs", os.getpid(), time.perf_counter() - started)
+    follower = asyncio.create_task(follow_changes()) if WORKERS > 1 else None
+    yield
+    if follower:
+        follower.cancel()
+
+app = FastAPI(lifespan=lifespan)
+route_class = admission.admitted(CachedRoute) if admission.ADMISSION else CachedRoute
+app.router.route_class = profiling.instrumented(route_class) if profiling.PROFILING else route_class
+if profiling.PROFILING:
+    app.add_middleware(profiling.ProfilingMiddleware)
+
+if replica_set is not None:
+    @app.middleware("http")
+    async def change_seq_header(request, call_next):
+        response = await call_next(request)
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            response.headers["X-Change-Seq"] = str(await run_in_threadpool(change_seq))
+        return response
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return profiling.metrics_response()
 
 @app.get('/')
 def Hello():
@@ -120,18 +271,25 @@ class CuratorResponse(CuratorCreate):
     id: int
 
 @app.post("/curators/", tags=["CRUD"], response_model=CuratorResponse)
+@write_route
 def create_curator(curator: CuratorCreate, db: dbDep):
-    curator_db = Curator.model_validate(curator)
+    curator_db = Curator(**curator.model_dump())
     db.add(curator_db)
     db.commit()
     db.refresh(curator_db)
     return curator_db
 
-@app.get("/curators/", tags=["CRUD"], response_model=List[CuratorResponse])
-def read_curators(db: dbDep):
-    return db.query(Curator).all()
+@app.get("/curators/", tags=["CRUD"], response_model=Union[List[CuratorResponse], Batch[CuratorResponse]])
+@cached(Curator)
+@db_route
+def read_curators(db: dbDep, page: pageDep, response: Response, ids: idsDep):
+    if ids is not None:
+        return multi_get(db, Curator, ids)
+    return paginate(db, Curator, page, response)
 
 @app.get("/curators/{curator_id}/", tags=["CRUD"])
+@cached(Curator)
+@db_route
 def read_curator(curator_id: int, db: dbDep):
     curator = db.get(Curator, curator_id)
     if not curator:
@@ -139,6 +297,7 @@ def read_curator(curator_id: int, db: dbDep):
     return curator   
 
 @app.put("/curators/{curator_id}/", tags=["CRUD"], response_model=CuratorResponse)
+@write_route
 def update_curator(curator_id: int, curator: CuratorCreate, db: dbDep):
     curator_db = db.get(Curator, curator_id)
     if not curator_db:
@@ -150,6 +309,7 @@ def update_curator(curator_id: int, curator: CuratorCreate, db: dbDep):
 
 
 @app.delete("/curators/{curator_id}/", tags=["CRUD"])
+@write_route
 def delete_curator(curator_id: int, db: dbDep):
     curator = db.get(Curator, curator_id)
     if not curator:
@@ -166,26 +326,36 @@ class GroupCreate(BaseModel):
 class GroupResponse(GroupCreate):
     id: int
 
+class GroupExpanded(GroupResponse):
+    curator: Optional[CuratorResponse] = None
+
 @app.post("/groups/", tags=["CRUD"], response_model=GroupResponse)
+@write_route
 def create_group(group: GroupCreate, db: dbDep):
-    group_db = Group.model_validate(group)
+    group_db = Group(**group.model_dump())
     db.add(group_db)
     db.commit()
     db.refresh(group_db)
     return group_db
 
-@app.get("/groups/", tags=["CRUD"], response_model=List[GroupResponse])
-def read_groups(db: dbDep):
-    return db.query(Group).all()
-
-@app.get("/groups/{group_id}/", tags=["CRUD"])
-def read_group(group_id: int, db: dbDep):
-    group = db.get(Group, group_id)
+@app.get("/groups/", tags=["CRUD"], response_model=Union[List[GroupResponse], Batch[GroupResponse]])
+@db_route
+def read_groups(db: dbDep, page: pageDep, response: Response, ids: idsDep, curator_id: Optional[int] = None):
+    if ids is not None:
+        return multi_get(db, Group, ids)
+    return paginate(db, Group, page, response, curator_id=curator_id)
+
+@app.get("/groups/{group_id}/", tags=["CRUD"], response_model=GroupExpanded, response_model_exclude_none=True)
+@db_route
+def read_group(group_id: int, db: dbDep, expand: Optional[str] = None):
+    relations = parse_expand(expand, Group)
+    group = get_expanded(db, Group, group_id, relations)
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
-    return group   
+    return expanded(group, relations)
 
 @app.put("/groups/{group_id}/", tags=["CRUD"], response_model=GroupResponse)
+@write_route
 def update_group(group_id: int, group: GroupCreate, db: dbDep):
     group_db = db.get(Group, group_id)
     if not group_db:
@@ -197,6 +367,7 @@ def update_group(group_id: int, group: GroupCreate, db: dbDep):
     return group_db
 
 @app.delete("/groups/{group_id}/", tags=["CRUD"])
+@write_route
 def delete_group(group_id: int, db: dbDep):
     group = db.get(Group, group_id)
     if not group:
@@ -209,31 +380,41 @@ def delete_group(group_id: int, db: dbDep):
 class StudentCreate(BaseModel):
     group_id: int
     name: str
-    birthday: str
+    birthday: date
 
 class StudentResponse(StudentCreate):
     id: int
 
+class StudentExpanded(StudentResponse):
+    group: Optional[GroupResponse] = None
+
 @app.post("/students/", tags=["CRUD"], response_model=StudentResponse)
+@write_route
 def create_student(student: StudentCreate, db: dbDep):
-    student_db = Student.model_validate(student)
+    student_db = Student(**student.model_dump())
     db.add(student_db)
     db.commit()
     db.refresh(student_db)
     return student_db
 
-@app.get("/students/", tags=["CRUD"], response_model=List[StudentResponse])
-def read_students(db: dbDep):
-    return db.query(Student).all()
-
-@app.get("/students/{student_id}/", tags=["CRUD"])
-def read_student(student_id: int, db: dbDep):
-    student = db.get(Student, student_id)
+@app.get("/students/", tags=["CRUD"], response_model=Union[List[StudentResponse], Batch[StudentResponse]])
+@db_route
+def read_students(db: dbDep, page: pageDep, response: Response, ids: idsDep, group_id: Optional[int] = None):
+    if ids is not None:
+        return multi_get(db, Student, ids)
+    return paginate(db, Student, page, response, group_id=group_id)
+
+@app.get("/students/{student_id}/", tags=["CRUD"], response_model=StudentExpanded, response_model_exclude_none=True)
+@db_route
+def read_student(student_id: int, db: dbDep, expand: Optional[str] = None):
+    relations = parse_expand(expand, Student)
+    student = get_expanded(db, Student, student_id, relations)
     if not student:
         raise HTTPException(status_code=404, detail="Student not found")
-    return student  
+    return expanded(student, relations)
 
 @app.put("/students/{student_id}/", tags=["CRUD"], response_model=StudentResponse)
+@write_route
 def update_student(student_id: int, student: StudentCreate, db: dbDep):
     student_db = db.get(Student, student_id)
     if not student_db:
@@ -246,6 +427,7 @@ def update_student(student_id: int, student: StudentCreate, db: dbDep):
     return student_db
 
 @app.delete("/students/{student_id}/", tags=["CRUD"])
+@write_route
 def delete_student(student_id: int, db: dbDep):
     student = db.get(Student, student_id)
     if not student:
@@ -262,18 +444,25 @@ class CourseResponse(CourseCreate):
     id: int
 
 @app.post("/courses/", tags=["CRUD"], response_model=CourseResponse)
+@write_route
 def create_course(course: CourseCreate, db: dbDep):
-    course_db = Course.model_validate(course)
+    course_db = Course(**course.model_dump())
     db.add(course_db)
     db.commit()
     db.refresh(course_db)
     return course_db
 
-@app.get("/courses/", tags=["CRUD"], response_model=List[CourseResponse])
-def read_courses(db: dbDep):
-    return db.query(Course).all()
+@app.get("/courses/", tags=["CRUD"], response_model=Union[List[CourseResponse], Batch[CourseResponse]])
+@cached(Course)
+@db_route
+def read_courses(db: dbDep, page: pageDep, response: Response, ids: idsDep):
+    if ids is not None:
+        return multi_get(db, Course, ids)
+    return paginate(db, Course, page, response)
 
 @app.get("/courses/{course_id}/", tags=["CRUD"])
+@cached(Course)
+@db_route
 def read_course(course_id: int, db: dbDep):
     course = db.get(Course, course_id)
     if not course:
@@ -281,6 +470,7 @@ def read_course(course_id: int, db: dbDep):
     return course  
 
 @app.put("/courses/{course_id}/", tags=["CRUD"], response_model=CourseResponse)
+@write_route
 def update_course(course_id: int, course: CourseCreate, db: dbDep):
     course_db = db.get(Course, course_id)
     if not course_db:
@@ -291,6 +481,7 @@ def update_course(course_id: int, course: CourseCreate, db: dbDep):
     return course_db
 
 @app.delete("/courses/{course_id}/", tags=["CRUD"])
+@write_route
 def delete_course(course_id: int, db: dbDep):
     course = db.get(Course, course_id)
     if not course:
@@ -309,18 +500,23 @@ class MarkResponse(MarkCreate):
     id: int
 
 @app.post("/marks/", tags=["CRUD"], response_model=MarkResponse)
+@write_route
 def create_mark(mark: MarkCreate, db: dbDep):
-    mark_db = Mark.model_validate(mark)
+    mark_db = Mark(**mark.model_dump())
     db.add(mark_db)
     db.commit()
     db.refresh(mark_db)
     return mark_db
 
-@app.get("/marks/", tags=["CRUD"], response_model=List[MarkResponse])
-def read_marks(db: dbDep):
-    return db.query(Mark).all()
+@app.get("/marks/", tags=["CRUD"], response_model=Union[List[MarkResponse], Batch[MarkResponse]])
+@db_route
+def read_marks(db: dbDep, page: pageDep, response: Response, ids: idsDep, course_id: Optional[int] = None, student_id: Optional[int] = None, mark: Optional[int] = None):
+    if ids is not None:
+        return multi_get(db, Mark, ids)
+    return paginate(db, Mark, page, response, course_id=course_id, student_id=student_id, mark=mark)
 
 @app.get("/marks/{mark_id}/", tags=["CRUD"])
+@db_route
 def read_mark(mark_id: int, db: dbDep):
     mark = db.get(Mark, mark_id)
     if not mark:
@@ -328,6 +524,7 @@ def read_mark(mark_id: int, db: dbDep):
     return mark  
 
 @app.put("/marks/{mark_id}/", tags=["CRUD"], response_model=MarkResponse)
+@write_route
 def update_mark(mark_id: int, mark: MarkCreate, db: dbDep):
     mark_db = db.get(Mark, mark_id)
     if not mark_db:
@@ -340,6 +537,7 @@ def update_mark(mark_id: int, mark: MarkCreate, db: dbDep):
     return mark_db
 
 @app.delete("/marks/{mark_id}/", tags=["CRUD"])
+@write_route
 def delete_mark(mark_id: int, db: dbDep):
     mark = db.get(Mark, mark_id)
     if not mark:
@@ -356,18 +554,25 @@ class DegreeResponse(DegreeCreate):
     id: int
 
 @app.post("/degrees/", tags=["CRUD"], response_model=DegreeResponse)
+@write_route
 def create_degree(degree: DegreeCreate, db: dbDep):
-    degree_db = Degree.model_validate(degree)
+    degree_db = Degree(**degree.model_dump())
     db.add(degree_db)
     db.commit()
     db.refresh(degree_db)
     return degree_db
 
-@app.get("/degrees/", tags=["CRUD"], response_model=List[DegreeResponse])
-def read_degrees(db: dbDep):
-    return db.query(Degree).all()
+@app.get("/degrees/", tags=["CRUD"], response_model=Union[List[DegreeResponse], Batch[DegreeResponse]])
+@cached(Degree)
+@db_route
+def read_degrees(db: dbDep, page: pageDep, response: Response, ids: idsDep):
+    if ids is not None:
+        return multi_get(db, Degree, ids)
+    return paginate(db, Degree, page, response)
 
 @app.get("/degrees/{degree_id}/", tags=["CRUD"])
+@cached(Degree)
+@db_route
 def read_degree(degree_id: int, db: dbDep):
     degree = db.get(Degree, degree_id)
     if not degree:
@@ -375,6 +580,7 @@ def read_degree(degree_id: int, db: dbDep):
     return degree  
 
 @app.put("/degrees/{degree_id}/", tags=["CRUD"], response_model=DegreeResponse)
+@write_route
 def update_degree(degree_id: int, degree: DegreeCreate, db: dbDep):
     degree_db = db.get(Degree, degree_id)
     if not degree_db:
@@ -385,6 +591,7 @@ def update_degree(degree_id: int, degree: DegreeCreate, db: dbDep):
     return degree_db
 
 @app.delete("/degrees/{degree_id}/", tags=["CRUD"])
+@write_route
 def delete_degree(degree_id: int, db: dbDep):
     degree = db.get(Degree, degree_id)
     if not degree:
@@ -401,18 +608,25 @@ class PositionResponse(PositionCreate):
     id: int
 
 @app.post("/positions/", tags=["CRUD"], response_model=PositionResponse)
+@write_route
 def create_position(position: PositionCreate, db: dbDep):
-    position_db = Position.model_validate(position)
+    position_db = Position(**position.model_dump())
     db.add(position_db)
     db.commit()
     db.refresh(position_db)
     return position_db
 
-@app.get("/positions/", tags=["CRUD"], response_model=List[PositionResponse])
-def read_positions(db: dbDep):
-    return db.query(Position).all()
+@app.get("/positions/", tags=["CRUD"], response_model=Union[List[PositionResponse], Batch[PositionResponse]])
+@cached(Position)
+@db_route
+def read_positions(db: dbDep, page: pageDep, response: Response, ids: idsDep):
+    if ids is not None:
+        return multi_get(db, Position, ids)
+    return paginate(db, Position, page, response)
 
 @app.get("/positions/{position_id}/", tags=["CRUD"])
+@cached(Position)
+@db_route
 def read_position(position_id: int, db: dbDep):
     position = db.get(Position, position_id)
     if not position:
@@ -420,6 +634,7 @@ def read_position(position_id: int, db: dbDep):
     return position  
 
 @app.put("/positions/{position_id}/", tags=["CRUD"], response_model=PositionResponse)
+@write_route
 def update_position(position_id: int, position: PositionCreate, db: dbDep):
     position_db = db.get(Position, position_id)
     if not position_db:
@@ -430,6 +645,7 @@ def update_position(position_id: int, position: PositionCreate, db: dbDep):
     return position_db
 
 @app.delete("/positions/{position_id}/", tags=["CRUD"])
+@write_route
 def delete_position(position_id: int, db: dbDep):
     position = db.get(Position, position_id)
     if not position:
@@ -447,26 +663,37 @@ class TeacherCreate(BaseModel):
 class TeacherResponse(TeacherCreate):
     id: int
 
+class TeacherExpanded(TeacherResponse):
+    degree: Optional[DegreeResponse] = None
+    position: Optional[PositionResponse] = None
+
 @app.post("/teachers/", tags=["CRUD"], response_model=TeacherResponse)
-def create_teacher(teacher: PositionCreate, db: dbDep):
-    teacher_db = Teacher.model_validate(teacher)
+@write_route
+def create_teacher(teacher: TeacherCreate, db: dbDep):
+    teacher_db = Teacher(**teacher.model_dump())
     db.add(teacher_db)
     db.commit()
     db.refresh(teacher_db)
     return teacher_db
 
-@app.get("/teachers/", tags=["CRUD"], response_model=List[TeacherResponse])
-def read_teachers(db: dbDep):
-    return db.query(Teacher).all()
-
-@app.get("/teachers/{teacher_id}/", tags=["CRUD"])
-def read_teacher(teacher_id: int, db: dbDep):
-    teacher = db.get(Teacher, teacher_id)
+@app.get("/teachers/", tags=["CRUD"], response_model=Union[List[TeacherResponse], Batch[TeacherResponse]])
+@db_route
+def read_teachers(db: dbDep, page: pageDep, response: Response, ids: idsDep, degree_id: Optional[int] = None, position_id: Optional[int] = None):
+    if ids is not None:
+        return multi_get(db, Teacher, ids)
+    return paginate(db, Teacher, page, response, degree_id=degree_id, position_id=position_id)
+
+@app.get("/teachers/{teacher_id}/", tags=["CRUD"], response_model=TeacherExpanded, response_model_exclude_none=True)
+@db_route
+def read_teacher(teacher_id: int, db: dbDep, expand: Optional[str] = None):
+    relations = parse_expand(expand, Teacher)
+    teacher = get_expanded(db, Teacher, teacher_id, relations)
     if not teacher:
         raise HTTPException(status_code=404, detail="Teacher not found")
-    return teacher  
+    return expanded(teacher, relations)
 
 @app.put("/teachers/{teacher_id}/", tags=["CRUD"], response_model=TeacherResponse)
+@write_route
 def update_teacher(teacher_id: int, teacher: TeacherCreate, db: dbDep):
     teacher_db = db.get(Teacher, teacher_id)
     if not teacher_db:
@@ -479,6 +706,7 @@ def update_teacher(teacher_id: int, teacher: TeacherCreate, db: dbDep):
     return teacher_db
 
 @app.delete("/teachers/{teacher_id}/", tags=["CRUD"])
+@write_route
 def delete_teacher(teacher_id: int, db: dbDep):
     teacher = db.get(Teacher, teacher_id)
     if not teacher:
@@ -492,42 +720,59 @@ class LessonCreate(BaseModel):
     group_id: int
     teacher_id: int
     course_id: int
+    time: NaiveDatetime
 
 class LessonResponse(LessonCreate):
     id: int
 
+class LessonExpanded(LessonResponse):
+    group: Optional[GroupResponse] = None
+    teacher: Optional[TeacherResponse] = None
+    course: Optional[CourseResponse] = None
+
 @app.post("/lessons/", tags=["CRUD"], response_model=LessonResponse)
+@write_route
 def create_lesson(lesson: LessonCreate, db: dbDep):
-    lesson_db = Lesson.model_validate(lesson)
+    check_lesson_conflicts(db, lesson)
+    lesson_db = Lesson(**lesson.model_dump())
     db.add(lesson_db)
     db.commit()
     db.refresh(lesson_db)
     return lesson_db
 
-@app.get("/lessons/", tags=["CRUD"], response_model=List[LessonResponse])
-def read_lessons(db: dbDep):
-    return db.query(Lesson).all()
-
-@app.get("/lessons/{lesson_id}/", tags=["CRUD"])
-def read_lesson(lesson_id: int, db: dbDep):
-    lesson = db.get(Lesson, lesson_id)
+@app.get("/lessons/", tags=["CRUD"], response_model=Union[List[LessonResponse], Batch[LessonResponse]])
+@db_route
+def read_lessons(db: dbDep, page: pageDep, response: Response, ids: idsDep, group_id: Optional[int] = None, teacher_id: Optional[int] = None, course_id: Optional[int] = None):
+    if ids is not None:
+        return multi_get(db, Lesson, ids)
+    return paginate(db, Lesson, page, response, group_id=group_id, teacher_id=teacher_id, course_id=course_id)
+
+@app.get("/lessons/{lesson_id}/", tags=["CRUD"], response_model=LessonExpanded, response_model_exclude_none=True)
+@db_route
+def read_lesson(lesson_id: int, db: dbDep, expand: Optional[str] = None):
+    relations = parse_expand(expand, Lesson)
+    lesson = get_expanded(db, Lesson, lesson_id, relations)
     if not lesson:
         raise HTTPException(status_code=404, detail="Lesson not found")
-    return lesson  
+    return expanded(lesson, relations)
 
 @app.put("/lessons/{lesson_id}/", tags=["CRUD"], response_model=LessonResponse)
+@write_route
 def update_lesson(lesson_id: int, lesson: LessonCreate, db: dbDep):
     lesson_db = db.get(Lesson, lesson_id)
     if not lesson_db:
         raise HTTPException(status_code=404, detail="Lesson not found")
+    check_lesson_conflicts(db, lesson, lesson_id)
     lesson_db.group_id = lesson.group_id
     lesson_db.teacher_id = lesson.teacher_id
     lesson_db.course_id = lesson.course_id
+    lesson_db.time = lesson.time
     db.commit()
     db.refresh(lesson_db)
     return lesson_db
 
 @app.delete("/lessons/{lesson_id}/", tags=["CRUD"])
+@write_route
 def delete_lesson(lesson_id: int, db: dbDep):
     lesson = db.get(Lesson, lesson_id)
     if not lesson:
@@ -536,19 +781,137 @@ def delete_lesson(lesson_id: int, db: dbDep):
     db.commit()
     return {"ok": True}
 
+# ----------------------------------------- BULK -------------------------------------------
+
+BULK_LIMIT = 10000
+
+class MarkBulk(MarkCreate):
+    id: Optional[int] = None
+
+class StudentBulk(StudentCreate):
+    id: Optional[int] = None
+
+class LessonBulk(LessonCreate):
+    id: Optional[int] = None
+
+class BulkError(BaseModel):
+    index: int
+    detail: str
+
+class BulkResult(BaseModel):
+    ids: List[Optional[int]]
+    errors: List[BulkError]
+
+# ids up to the last closed term's belong to archived marks and are never written again
+def mark_checker(db):
+    closed_id = db.scalar(select(func.max(Term.last_mark_id))) or 0
+    def check_mark(row):
+        if not 2 <= row.mark <= 5:
+            return "mark must be between 2 and 5"
+        if row.id is not None and row.id <= closed_id:
+            return f"id {row.id} belongs to a closed term"
+    return check_mark
+
+# rows without id are inserted, rows with id are upserted; foreign keys are checked
+# against the set of ids that exist (one WHERE id IN (...) per chunk, as in multi_get),
+# so bad rows are reported instead of failing the batch
+def bulk_write(db, model, rows, foreign_keys, check=None):
+    known = {}
+    for column, target in foreign_keys.items():
+        wanted = list({getattr(row, column) for row in rows})
+        known[column] = set()
+        for start in range(0, len(wanted), IN_CHUNK):
+            known[column].update(db.scalars(select(target.id).where(target.id.in_(wanted[start:start + IN_CHUNK]))))
+    errors = []
+    valid = []
+    for index, row in enumerate(rows):
+        detail = check(row) if check else None
+        for column, ids in known.items():
+            if detail is None and getattr(row, column) not in ids:
+                detail = f"{column} {getattr(row, column)} not found"
+        if detail:
+            errors.append(BulkError(index=index, detail=detail))
+        else:
+            valid.append(index)
+    ids = [None] * len(rows)
+    if valid:
+        statement = sqlite_insert(model)
+        columns = [column.name for column in model.__table__.columns if column.name != "id"]
+        statement = statement.on_conflict_do_update(
+            index_elements=[model.id],
+            set_={column: statement.excluded[column] for column in columns},
+        ).returning(model.id, sort_by_parameter_order=True)
+        created = db.scalars(statement, [rows[index].model_dump() for index in valid]).all()
+        db.commit()
+        for index, row_id in zip(valid, created):
+            ids[index] = row_id
+    return BulkResult(ids=ids, errors=errors)
+
+@app.post("/marks/bulk", tags=["Bulk"], response_model=BulkResult)
+@db_route
+def create_marks_bulk(marks: Annotated[List[MarkBulk], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return bulk_write(db, Mark, marks, {"course_id": Course, "student_id": Student}, mark_checker(db))
+
+@app.post("/students/bulk", tags=["Bulk"], response_model=BulkResult)
+@db_route
+def create_students_bulk(students: Annotated[List[StudentBulk], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return bulk_write(db, Student, students, {"group_id": Group})
+
+@app.post("/lessons/bulk", tags=["Bulk"], response_model=BulkResult)
+@db_route
+def create_lessons_bulk(lessons: Annotated[List[LessonBulk], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return bulk_write(db, Lesson, lessons, {"group_id": Group, "teacher_id": Teacher, "course_id": Course})
+
+# multi-get for id lists too long for ?ids=
+
+@app.post("/curators/batch-get", tags=["Bulk"], response_model=Batch[CuratorResponse])
+@db_route
+def batch_get_curators(ids: Annotated[List[int], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return multi_get(db, Curator, ids)
+
+@app.post("/groups/batch-get", tags=["Bulk"], response_model=Batch[GroupResponse])
+@db_route
+def batch_get_groups(ids: Annotated[List[int], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return multi_get(db, Group, ids)
+
+@app.post("/students/batch-get", tags=["Bulk"], response_model=Batch[StudentResponse])
+@db_route
+def batch_get_students(ids: Annotated[List[int], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return multi_get(db, Student, ids)
+
+@app.post("/courses/batch-get", tags=["Bulk"], response_model=Batch[CourseResponse])
+@db_route
+def batch_get_courses(ids: Annotated[List[int], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return multi_get(db, Course, ids)
+
+@app.post("/marks/batch-get", tags=["Bulk"], response_model=Batch[MarkResponse])
+@db_route
+def batch_get_marks(ids: Annotated[List[int], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return multi_get(db, Mark, ids)
+
+@app.post("/degrees/batch-get", tags=["Bulk"], response_model=Batch[DegreeResponse])
+@db_route
+def batch_get_degrees(ids: Annotated[List[int], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return multi_get(db, Degree, ids)
+
+@app.post("/positions/batch-get", tags=["Bulk"], response_model=Batch[PositionResponse])
+@db_route
+def batch_get_positions(ids: Annotated[List[int], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return multi_get(db, Position, ids)
+
+@app.post("/teachers/batch-get", tags=["Bulk"], response_model=Batch[TeacherResponse])
+@db_route
+def batch_get_teachers(ids: Annotated[List[int], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return multi_get(db, Teacher, ids)
+
+@app.post("/lessons/batch-get", tags=["Bulk"], response_model=Batch[LessonResponse])
+@db_route
+def batch_get_lessons(ids: Annotated[List[int], Body(max_length=BULK_LIMIT)], db: dbDep):
+    return multi_get(db, Lesson, ids)
+
 #-------------------------------------- JUST FOR CHILL --------------------------------------
 
-admin = Admin(engine, title="DataBase")
-admin.add_view(ModelView(Student))
-admin.add_view(ModelView(Lesson))
-admin.add_view(ModelView(Group))
-admin.add_view(ModelView(Teacher))
-admin.add_view(ModelView(Mark))
-admin.add_view(ModelView(Course))
-admin.add_view(ModelView(Curator))
-admin.add_view(ModelView(Degree))
-admin.add_view(ModelView(Position))
-admin.mount_to(app)
+mount_admin(app, database.admin_engine, [Student, Lesson, Group, Teacher, Mark, Course, Curator, Degree, Position])
 
 # ---------------------------------------- QUERIES ------------------------------------------
 
@@ -560,7 +923,15 @@ class ScheduleResponse(BaseModel):
     group_name: str
     course: str
     teacher: str
-    lesson_time:str   
+    lesson_time: datetime
+
+class ConflictResponse(BaseModel):
+    kind: Literal["group", "teacher"]
+    owner_id: int
+    lesson_id: int
+    time: datetime
+    other_lesson_id: int
+    other_time: datetime
 
 class TeacherCourseResponse(BaseModel):
     teacher: str
@@ -576,54 +947,111 @@ class TeacherInfoResponse(BaseModel):
     degree: str
     position: str
 
-@app.get("/students/avg-grades//", tags=["Queries"], response_model=List[StudentAvgGrade])
-def get_students_avg_grades(db: dbDep):
-    result = db.query(
-        Student.name.label("student_name"),
-        func.round(func.avg(Mark.mark), 2).label("average_grade")
-    ).join(
-        Mark, Student.id == Mark.student_id
-    ).group_by(
-        Student.id
-    ).all()
+class AboveAverageResponse(BaseModel):
+    student_name: str
+    average_grade: float
+    group_average: float
 
-    return result
+def student_average():
+    return StudentGrade.total * 1.0 / StudentGrade.count
 
-@app.get("/schedule/{group_id}/", tags=["Queries"], response_model=List[ScheduleResponse])
-def schedule(group_id: int, db: dbDep):
-    result = db.query(
-        Lesson.time.label("lesson_time"),
-        Group.name_number.label("group_name"),
-        Course.title.label("course"),
-        Teacher.name.label("teacher"),
+def avg_grades_query(db):
+    return db.query(
+        Student.name.label("student_name"),
+        func.round(student_average(), 2).label("average_grade")
     ).join(
-        Group, Lesson.group_id == Group.id
+        StudentGrade, Student.id == StudentGrade.student_id
+    ).where(
+        StudentGrade.count > 0
+    ).order_by(Student.id)
+
+def above_average_query(db, group_id):
+    return db.query(
+        Student.name.label("student_name"),
+        func.round(student_average(), 2).label("average_grade"),
+        func.round(GroupGrade.total * 1.0 / GroupGrade.count, 2).label("group_average"),
     ).join(
-        Course, Lesson.course_id == Course.id
+        StudentGrade, Student.id == StudentGrade.student_id
     ).join(
-        Teacher, Lesson.teacher_id == Teacher.id
+        GroupGrade, StudentGrade.group_id == GroupGrade.group_id
     ).where(
-        Group.id == group_id
-    ).order_by(Lesson.time).all()
-
-    return result
-
-@app.get("/teacher-load/", tags=["Queries"], response_model=List[TeacherCourseResponse])
-def teacher_load(db: dbDep):
-    result = db.query(
+        StudentGrade.group_id == group_id,
+        StudentGrade.count > 0,
+        StudentGrade.total * GroupGrade.count >= GroupGrade.total * StudentGrade.count
+    ).order_by(student_average().desc())
+
+def timetable_query(db, column, value, start=None, end=None):
+    query = db.query(
+        ScheduleEntry.time.label("lesson_time"),
+        ScheduleEntry.group_name,
+        ScheduleEntry.course,
+        ScheduleEntry.teacher,
+    ).where(column == value)
+    if start is not None:
+        query = query.where(ScheduleEntry.time >= start)
+    if end is not None:
+        query = query.where(ScheduleEntry.time < end)
+    return query.order_by(ScheduleEntry.time)
+
+def schedule_query(db, group_id, start=None, end=None):
+    return timetable_query(db, ScheduleEntry.group_id, group_id, start, end)
+
+def teacher_schedule_query(db, teacher_id, start=None, end=None):
+    return timetable_query(db, ScheduleEntry.teacher_id, teacher_id, start, end)
+
+def week_bounds(start):
+    start = datetime.combine(start, datetime.min.time())
+    return start, start + timedelta(days=7)
+
+# a group or teacher is double-booked when another of its lessons starts less than LESSON_LENGTH
+# before or after this one: a range seek on (group_id, time) or (teacher_id, time), LIMIT 1
+def lesson_conflict_query(db, column, value, time, lesson_id=None):
+    query = db.query(Lesson.id, Lesson.time).filter(
+        column == value, Lesson.time > time - LESSON_LENGTH, Lesson.time < time + LESSON_LENGTH,
+    )
+    if lesson_id is not None:
+        query = query.filter(Lesson.id != lesson_id)
+    return query.limit(1)
+
+# pysqlite sends BEGIN only with the first INSERT/UPDATE, so the SELECTs below would run before
+# any lock is held and two requests could both pass and double-book; BEGIN IMMEDIATE takes the
+# write lock first and holds it to the commit. batches of the write queue already run under one
+def check_lesson_conflicts(db, lesson, lesson_id=None):
+    if not isinstance(db, writes.BatchSession):
+        db.execute(text("BEGIN IMMEDIATE"))
+    for column, owner in ((Lesson.group_id, "Group"), (Lesson.teacher_id, "Teacher")):
+        conflict = lesson_conflict_query(db, column, getattr(lesson, column.key), lesson.time, lesson_id).first()
+        if conflict:
+            raise HTTPException(status_code=409, detail=f"{owner} already has lesson {conflict.id} at {conflict.time.isoformat()}")
+
+# every pair of lessons of one group or teacher closer than LESSON_LENGTH, found with one
+# index range seek per lesson of the period
+def conflicts_query(db, start=None, end=None):
+    pairs = []
+    for kind, column in (("group", "group_id"), ("teacher", "teacher_id")):
+        where = " AND ".join(
+            [f"other.{column} = l.{column}", "other.time >= l.time",
+             f"other.time < strftime('%Y-%m-%dT%H:%M:%S', l.time, '+{int(LESSON_LENGTH.total_seconds())} seconds')",
+             "(other.time > l.time OR other.id > l.id)"]
+            + (["l.time >= :start"] if start is not None else []) + (["l.time < :end"] if end is not None else [])
+        )
+        pairs.append(f"SELECT '{kind}' AS kind, l.{column} AS owner_id, l.id AS lesson_id, l.time AS time, other.id AS other_lesson_id, "
+                     f"other.time AS other_time FROM Lessons l JOIN Lessons other ON {where}")
+    params = {"start": start and start.isoformat(timespec="seconds"), "end": end and end.isoformat(timespec="seconds")}
+    return db.execute(text(" UNION ALL ".join(pairs) + " ORDER BY time, kind, lesson_id"), params).all()
+
+def teacher_load_query(db):
+    return db.query(
         Teacher.name.label("teacher"),
         Course.title.label("course"),
     ).join(
-        Lesson, Teacher.id == Lesson.id
+        Lesson, Teacher.id == Lesson.teacher_id
     ).join(
         Course, Lesson.course_id == Course.id
-    ).all()
-
-    return result
+    )
 
-@app.get("/curator-load/", tags=["Queries"], response_model=List[CuratorStudentsResponse])
-def curator_load(db: dbDep):
-    result = db.query(
+def curator_load_query(db):
+    return db.query(
         Curator.name.label("curator"),
         func.aggregate_strings(Student.name, ", ").label("students"),
         func.count(distinct(Student.id)).label("stud_count"),
@@ -633,13 +1061,10 @@ def curator_load(db: dbDep):
         Student, Group.id == Student.group_id
     ).group_by(
         Curator.name
-    ).all()
-
-    return result
+    )
 
-@app.get("/teacher-info/", tags=["Queries"], response_model=List[TeacherInfoResponse])
-def teacher_load(db: dbDep):
-    result = db.query(
+def teacher_info_query(db):
+    return db.query(
         Degree.title.label("degree"),
         Teacher.name.label("teacher"),
         Position.title.label("position")
@@ -647,9 +1072,380 @@ def teacher_load(db: dbDep):
         Teacher, Degree.id == Teacher.degree_id
     ).join(
         Position, Teacher.position_id == Position.id
-    ).all()
+    )
+
+@app.get("/students/avg-grades//", tags=["Queries"], response_model=List[StudentAvgGrade])
+@cached(Student, Mark)
+@replica_read
+@db_route
+def get_students_avg_grades(db: dbDep):
+    return avg_grades_query(db).all()
+
+@app.get("/groups/{group_id}/above-average/", tags=["Queries"], response_model=List[AboveAverageResponse])
+@cached(Group, Student, Mark)
+@replica_read
+@db_route
+def get_group_above_average(group_id: int, db: dbDep):
+    if not db.get(Group, group_id):
+        raise HTTPException(status_code=404, detail="Group not found")
+    return above_average_query(db, group_id).all()
+
+@app.get("/schedule/conflicts/", tags=["Queries"], response_model=List[ConflictResponse])
+@cached(Lesson)
+@replica_read
+@db_route
+def schedule_conflicts(db: dbDep, start: Optional[NaiveDatetime] = None, end: Optional[NaiveDatetime] = None):
+    return conflicts_query(db, start, end)
+
+# start/end bound the lesson time: start <= time < end, either may be left out
+@app.get("/schedule/{group_id}/", tags=["Queries"], response_model=List[ScheduleResponse])
+@cached(Lesson, Group, Course, Teacher)
+@replica_read
+@db_route
+def schedule(group_id: int, db: dbDep, start: Optional[NaiveDatetime] = None, end: Optional[NaiveDatetime] = None):
+    return schedule_query(db, group_id, start, end).all()
+
+@app.get("/schedule/{group_id}/week/{start}/", tags=["Queries"], response_model=List[ScheduleResponse])
+@cached(Lesson, Group, Course, Teacher)
+@replica_read
+@db_route
+def schedule_week(group_id: int, start: date, db: dbDep):
+    return timetable_query(db, ScheduleEntry.group_id, group_id, *week_bounds(start)).all()
+
+@app.get("/schedule/teacher/{teacher_id}/", tags=["Queries"], response_model=List[ScheduleResponse])
+@cached(Lesson, Group, Course, Teacher)
+@replica_read
+@db_route
+def teacher_schedule(teacher_id: int, db: dbDep, start: Optional[NaiveDatetime] = None, end: Optional[NaiveDatetime] = None):
+    return teacher_schedule_query(db, teacher_id, start, end).all()
+
+@app.get("/schedule/teacher/{teacher_id}/week/{start}/", tags=["Queries"], response_model=List[ScheduleResponse])
+@cached(Lesson, Group, Course, Teacher)
+@replica_read
+@db_route
+def teacher_schedule_week(teacher_id: int, start: date, db: dbDep):
+    return timetable_query(db, ScheduleEntry.teacher_id, teacher_id, *week_bounds(start)).all()
+
+@app.get("/teacher-load/", tags=["Queries"], response_model=List[TeacherCourseResponse])
+@cached(Teacher, Lesson, Course)
+@replica_read
+@db_route
+def teacher_load(db: dbDep):
+    return teacher_load_query(db).all()
+
+@app.get("/curator-load/", tags=["Queries"], response_model=List[CuratorStudentsResponse])
+@cached(Curator, Group, Student)
+@replica_read
+@db_route
+def curator_load(db: dbDep):
+    return curator_load_query(db).all()
 
-    return result
+@app.get("/teacher-info/", tags=["Queries"], response_model=List[TeacherInfoResponse])
+@cached(Degree, Teacher, Position)
+@replica_read
+@db_route
+def teacher_info(db: dbDep):
+    return teacher_info_query(db).all()
+
+# ---------------------------------------- SEARCH ------------------------------------------
+
+SEARCH_LIMIT = 100
+
+class SearchResult(BaseModel):
+    type: str
+    id: int
+    name: str
+
+# each index is ranked over all its matches and cut to limit on its own with FTS5's ORDER BY rank
+# LIMIT (bm25 kept in a top-N heap, no sort) and only those rows are joined to their table for the
+# name; the merged list is ranked and cut once more, ties by type and id
+def search_query(db, match, types, limit):
+    selects = []
+    for kind in types:
+        table = SEARCH_TABLES[kind]
+        fts = search_table(table)
+        selects.append(
+            f"SELECT '{kind}' AS type, t.id AS id, t.name AS name, hits.rank AS rank FROM "
+            f"(SELECT rowid AS id, rank FROM {fts} WHERE {fts} MATCH :match ORDER BY rank LIMIT :limit) hits "
+            f"JOIN {table.name} t ON t.id = hits.id"
+        )
+    sql = " UNION ALL ".join(selects) + " ORDER BY rank, type, id LIMIT :limit"
+    return db.execute(text(sql), {"match": match, "limit": limit}).all()
+
+@app.get("/search/", tags=["Search"], response_model=List[SearchResult])
+@cached(Student, Teacher, Curator)
+@time_budget(1)
+@replica_read
+@db_route
+def search(db: dbDep, q: Annotated[str, Query(min_length=1)], type: Optional[Literal["student", "teacher", "curator"]] = None,
+           limit: Annotated[int, Query(ge=1, le=SEARCH_LIMIT)] = 20):
+    match = match_query(q)
+    if not match:
+        return []
+    return search_query(db, match, [type] if type else list(SEARCH_TABLES), limit)
+
+# ----------------------------------------- TERMS ------------------------------------------
+
+class TermResponse(BaseModel):
+    id: int
+    name: str
+    last_mark_id: int
+    marks: int
+    closed_at: str
+
+# Marks as it lies in a term file, ATTACHed as `term` by attached_term
+term_marks = Mark.__table__.to_metadata(MetaData(), schema="term")
+
+@app.get("/terms/", tags=["Terms"], response_model=List[TermResponse])
+@db_route
+def read_terms(db: dbDep):
+    return db.query(Term).order_by(Term.id).all()
+
+@app.get("/terms/{name}/marks/", tags=["Terms"], response_model=List[MarkResponse])
+@db_route
+def read_term_marks(name: str, db: dbDep, page: pageDep, response: Response, course_id: Optional[int] = None,
+                    student_id: Optional[int] = None, mark: Optional[int] = None):
+    term = db.query(Term).filter(Term.name == name).first()
+    if not term:
+        raise HTTPException(status_code=404, detail="Term not found")
+    with attached_term(db, term):
+        return paginate(db, term_marks, page, response, course_id=course_id, student_id=student_id, mark=mark)
+
+# ---------------------------------------- EXPORT ------------------------------------------
+
+EXPORT_CHUNK = 1000
+
+def table_query(model):
+    return lambda db: db.query(*model.__table__.columns).order_by(model.id)
+
+EXPORT_QUERIES = {
+    model.__tablename__.lower(): table_query(model)
+    for model in (Curator, Group, Student, Course, Mark, Degree, Position, Teacher, Lesson)
+}
+EXPORT_QUERIES.update({
+    "avg-grades": avg_grades_query,
+    "schedule": schedule_query,
+    "teacher-load": teacher_load_query,
+    "curator-load": curator_load_query,
+    "teacher-info": teacher_info_query,
+})
+
+# own session instead of dbDep: yield dependencies are closed before the body is streamed
+def stream_export(build_query, fmt, params):
+    with Session(engine) as db:
+        query = build_query(db, **params).yield_per(EXPORT_CHUNK)
+        header = [column["name"] for column in query.column_descriptions]
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if fmt == "csv":
+            writer.writerow(header)
+        for i, row in enumerate(query, 1):
+            if fmt == "csv":
+                writer.writerow([value.isoformat() if isinstance(value, (date, datetime)) else value for value in row])
+            else:
+                buffer.write(json.dumps(dict(zip(header, row)), ensure_ascii=False, default=json_default) + "\n")
+            if i % EXPORT_CHUNK == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+@app.get("/replicas/", tags=["Replicas"])
+def replica_status():
+    return replica_set.status() if replica_set else []
+
+@app.get("/cache/stats/", tags=["Cache"])
+def cache_stats():
+    return response_cache.stats
+
+@app.get("/export/{table}", tags=["Export"])
+def export(table: str, fmt: Annotated[Literal["ndjson", "csv"], Query(alias="format")] = "ndjson", group_id: Optional[int] = None):
+    if table not in EXPORT_QUERIES:
+        raise HTTPException(status_code=404, detail="Unknown table")
+    params = {}
+    if table == "schedule":
+        if group_id is None:
+            raise HTTPException(status_code=400, detail="group_id is required for schedule export")
+        params["group_id"] = group_id
+    media_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return StreamingResponse(stream_export(EXPORT_QUERIES[table], fmt, params), media_type=media_type)
+
+# ---------------------------------------- CHANGES -----------------------------------------
+
+class ChangeResponse(BaseModel):
+    seq: int
+    table: str
+    row_id: int
+    op: str
+    data: Optional[dict] = None
+    changed_at: str
+
+def read_change_log(since, limit, table):
+    with Session(engine) as db:
+        horizon = db.get(ChangeHorizon, 1)
+        if since and horizon and since < horizon.seq:
+            raise HTTPException(status_code=410, detail=f"Changes up to seq {horizon.seq} were compacted, resync from since=0")
+        query = db.query(Change).filter(Change.seq > since)
+        if table is not None:
+            query = query.filter(Change.table_name == table)
+        return [
+            {"seq": change.seq, "table": change.table_name, "row_id": change.row_id, "op": change.op,
+             "data": json.loads(change.data) if change.data else None, "changed_at": change.changed_at}
+            for change in query.order_by(Change.seq).limit(limit)
+        ]
+
+# deltas after a seq; with wait > 0 the request is held until a change arrives (long-poll).
+# inserts and updates carry the full row, so consumers apply both as upserts
+@app.get("/changes/", tags=["Changes"], response_model=List[ChangeResponse])
+async def read_changes(since: int = 0, limit: Annotated[int, Query(ge=1, le=1000)] = 100, table: Optional[str] = None,
+                       wait: Annotated[float, Query(ge=0, le=60)] = 0):
+    deadline = time.monotonic() + wait
+    while True:
+        changes = await run_in_threadpool(read_change_log, since, limit, table)
+        if changes or time.monotonic() >= deadline:
+            return changes
+        await asyncio.sleep(CHANGES_POLL)
+
+async def stream_changes(since, table):
+    idle = 0.0
+    while True:
+        changes = await run_in_threadpool(read_change_log, since, 1000, table)
+        for change in changes:
+            yield f"id: {change['seq']}\nevent: change\ndata: {json.dumps(change, ensure_ascii=False)}\n\n"
+            since = change["seq"]
+        if not changes:
+            await asyncio.sleep(CHANGES_POLL)
+            idle += CHANGES_POLL
+            if idle >= 15:
+                idle = 0.0
+                yield ": keep-alive\n\n"
+
+# server-sent events; reconnecting clients resume from Last-Event-ID
+@app.get("/changes/stream/", tags=["Changes"])
+def changes_stream(since: int = 0, table: Optional[str] = None, last_event_id: Annotated[Optional[int], Header()] = None):
+    if last_event_id is not None:
+        since = last_event_id
+    read_change_log(since, 1, table)
+    return StreamingResponse(stream_changes(since, table), media_type="text/event-stream")
+
+# --------------------------------------- ANALYTICS ----------------------------------------
+
+mark_store = analytics.MarkStore(engine)
+
+class MarkStats(BaseModel):
+    key: int
+    count: int
+    mean: float
+    std: float
+    p25: int
+    p50: int
+    p75: int
+    p90: int
+
+class StudentAboveGroup(BaseModel):
+    student_id: int
+    group_id: int
+    average_grade: float
+    group_average: float
+
+@app.get("/analytics/distribution/", tags=["Analytics"], response_model=Dict[str, int])
+@cached(Mark, Student)
+def analytics_distribution(course_id: Optional[int] = None, group_id: Optional[int] = None):
+    mark_store.refresh()
+    return mark_store.distribution(course_id, group_id)
+
+@app.get("/analytics/stats/{by}/", tags=["Analytics"], response_model=List[MarkStats])
+@cached(Mark, Student)
+def analytics_stats(by: Literal["student", "course", "group"]):
+    mark_store.refresh()
+    return mark_store.stats(by)
+
+@app.get("/analytics/above-group-average/", tags=["Analytics"], response_model=List[StudentAboveGroup])
+@cached(Mark, Student)
+def analytics_above_group_average():
+    mark_store.refresh()
+    return mark_store.above_group_average()
+
+# ------------------------------------- INDEX ADVISOR ---------------------------------------
+
+LIST_FILTERS = {
+    Group: ["curator_id"],
+    Student: ["group_id"],
+    Mark: ["course_id", "student_id", "mark"],
+    Teacher: ["degree_id", "position_id"],
+    Lesson: ["group_id", "teacher_id", "course_id"],
+}
+
+def advised_queries(db):
+    queries = {
+        "avg-grades": avg_grades_query(db),
+        "above-average": above_average_query(db, 1),
+        "schedule": schedule_query(db, 1),
+        "teacher-schedule": teacher_schedule_query(db, 1),
+        "schedule-week": schedule_query(db, 1, *week_bounds(date(2024, 9, 2))),
+        "lesson-conflict": lesson_conflict_query(db, Lesson.teacher_id, 1, datetime(2024, 9, 2, 9), 1),
+        "teacher-load": teacher_load_query(db),
+        "curator-load": curator_load_query(db),
+        "teacher-info": teacher_info_query(db),
+    }
+    # the first page of a filtered list: with the keyset predicate (id > cursor) in the probe an
+    # unindexed filter would plan as a rowid range SEARCH and hide the full scan
+    for model, columns in LIST_FILTERS.items():
+        for column in columns:
+            queries[f"{model.__tablename__.lower()}?{column}="] = db.query(model).filter_by(**{column: 1}).order_by(model.id).limit(101)
+    return queries
+
+# a list page must neither scan the table nor sort the matching rows (keyset pages are read in id order)
+def advise_indexes():
+    report = {}
+    with Session(engine) as db:
+        for name, query in advised_queries(db).items():
+            sql = str(query.statement.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = [row[3] for row in db.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+            scans = [step for step in plan if step.startswith("SCAN ") and " USING " not in step]
+            if "?" in name:
+                scans += [step for step in plan if step.startswith("USE TEMP B-TREE FOR ORDER BY")]
+            report[name] = {"plan": plan, "full_scans": scans}
+    return report
 
 if __name__ == '__main__':
-    uvicorn.run("main:app", reload=True)
\ No newline at end of file
+    if sys.argv[1:] == ["advise-indexes"]:
+        for name, advice in advise_indexes().items():
+            print(("FULL SCAN " if advice["full_scans"] else "ok        ") + name)
+            for step in advice["plan"]:
+                print("    " + step)
+    elif sys.argv[1:] == ["create-indexes"]:
+        create_indexes()
+    elif sys.argv[1:] == ["rebuild-schedule"]:
+        rebuild_schedule()
+    elif sys.argv[1:] == ["rebuild-search"]:
+        rebuild_search()
+    elif sys.argv[1:2] == ["close-term"] and len(sys.argv) == 3:
+        print(json.dumps(close_term(sys.argv[2])))
+        # the change log stays silent about archived marks, so a shared cache is told here
+        response_cache.invalidate({"Marks"})
+    elif sys.argv[1:] == ["compact-changes"]:
+        print(json.dumps(compact_changes()))
+    elif sys.argv[1:] == ["rebuild-grades"]:
+        rebuild_grades()
+    elif sys.argv[1:] == ["verify-grades"]:
+        mismatches = verify_grades()
+        for table, rows in mismatches.items():
+            for row in rows:
+                print(table, tuple(row))
+        sys.exit(1 if any(mismatches.values()) else 0)
+    elif sys.argv[1:2] == ["serve"]:
+        import argparse
+        parser = argparse.ArgumentParser(prog="main.py serve")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8000)
+        parser.add_argument("--no-warmup", action="store_true")
+        args = parser.parse_args(sys.argv[2:])
+        # schema, indexes and replica snapshots were prepared by this import; the workers skip them.
+        # exec so uvicorn is the supervisor and the workers import main once, not as __mp_main__ too
+        os.environ.update(SCHEMA_INIT="0", WORKERS=str(args.workers), WARMUP="0" if args.no_warmup else "1")
+        os.execv(sys.executable, [sys.executable, "-m", "uvicorn", "main:app", "--host", args.host, "--port", str(args.port),
+                                  "--workers", str(args.workers), "--no-access-log"])
+    else:
+        uvicorn.run("main:app", reload=True)
\ No newline at end of file
@@ -0,0 +1,510 @@
+from sqlalchemy import event, text, DDL, Column, Index, Integer, String, Date, ForeignKey, CheckConstraint
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.dialects.sqlite import DATETIME
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.orm import declarative_base, relationship
+import re
+
+
+Base = declarative_base()
+
+# ISO 8601 text, the layout the API has always used for lesson times: it sorts chronologically,
+# so range filters and ORDER BY time use the (group_id, time) / (teacher_id, time) indexes
+LessonTime = DATETIME(
+    storage_format="%(year)04d-%(month)02d-%(day)02dT%(hour)02d:%(minute)02d:%(second)02d",
+    regexp=r"(\d+)-(\d+)-(\d+)T(\d+):(\d+):(\d+)",
+)
+
+class Curator(Base):
+    __tablename__ = "Curators"
+ 
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False)
+
+class Group(Base):
+    __tablename__ = "Groups"
+ 
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    curator_id = Column(Integer, ForeignKey('Curators.id'), nullable=False, unique=True)
+    name_number = Column(String, nullable=False)
+
+    curator = relationship("Curator")
+
+class Student(Base):
+    __tablename__ = "Students"
+    __table_args__ = (
+        Index("ix_students_group_id", "group_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    group_id = Column(Integer, ForeignKey('Groups.id'), nullable=False)
+    name = Column(String, nullable=False)
+    birthday = Column(Date, nullable=False)
+
+    group = relationship("Group")
+
+
+class Course(Base):
+    __tablename__ = "Courses"
+ 
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    title = Column(String, nullable=False, unique=True)  
+
+class Mark(Base):
+    __tablename__ = "Marks"
+    __table_args__ = (
+        CheckConstraint('mark >= 2 AND mark <= 5', name='mark_range_check'),
+        Index("ix_marks_student_id", "student_id"),
+        Index("ix_marks_course_id", "course_id"),
+        # closed terms keep their marks' ids, so an emptied table must not hand them out again
+        {"sqlite_autoincrement": True},
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    course_id = Column(Integer, ForeignKey('Courses.id'), nullable=False)
+    student_id = Column(Integer, ForeignKey('Students.id', ondelete='CASCADE'), nullable=False)
+    mark = Column(Integer)
+
+    course = relationship("Course")
+    student = relationship("Student")
+
+class Degree(Base):
+    __tablename__ = "Degrees"
+ 
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    title = Column(String, nullable=False, unique=True)
+
+class Position(Base):
+    __tablename__ = "Positions"
+ 
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    title = Column(String, nullable=False)
+
+class Teacher(Base):
+    __tablename__ = "Teachers"
+    __table_args__ = (
+        Index("ix_teachers_degree_id", "degree_id"),
+        Index("ix_teachers_position_id", "position_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    degree_id = Column(Integer, ForeignKey('Degrees.id'), nullable=False)
+    position_id = Column(Integer, ForeignKey('Positions.id'), nullable=False)
+    name = Column(String, nullable=False)
+
+    degree = relationship("Degree")
+    position = relationship("Position")
+
+
+class Lesson(Base):
+    __tablename__ = "Lessons"
+    __table_args__ = (
+        # the single-column indexes serve the keyset list pages (id order within the value, no
+        # sort); the (x, time) ones the schedule and conflict range seeks
+        Index("ix_lessons_group_id", "group_id"),
+        Index("ix_lessons_teacher_id", "teacher_id"),
+        Index("ix_lessons_group_id_time", "group_id", "time"),
+        Index("ix_lessons_teacher_id_time", "teacher_id", "time"),
+        Index("ix_lessons_course_id", "course_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    group_id = Column(Integer, ForeignKey('Groups.id'), nullable=False)
+    teacher_id = Column(Integer, ForeignKey('Teachers.id', ondelete='CASCADE'), nullable=False)
+    course_id = Column(Integer, ForeignKey('Courses.id'), nullable=False)
+    time = Column(LessonTime, nullable=False)
+
+    group = relationship("Group")
+    teacher = relationship("Teacher")
+    course = relationship("Course")
+
+
+# ---------------------------------------- GRADES ------------------------------------------
+# running per-student/per-group mark aggregates, kept up to date by triggers on Marks and Students
+# so every writer (CRUD, bulk, cascades, raw sqlite scripts) updates them in its own transaction
+
+MARK_HISTOGRAM = {"count_2": 2, "count_3": 3, "count_4": 4, "count_5": 5}
+
+class StudentGrade(Base):
+    __tablename__ = "StudentGrades"
+
+    student_id = Column(Integer, primary_key=True)
+    group_id = Column(Integer, index=True)
+    total = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+    count_2 = Column(Integer, nullable=False, default=0)
+    count_3 = Column(Integer, nullable=False, default=0)
+    count_4 = Column(Integer, nullable=False, default=0)
+    count_5 = Column(Integer, nullable=False, default=0)
+
+class GroupGrade(Base):
+    __tablename__ = "GroupGrades"
+
+    group_id = Column(Integer, primary_key=True)
+    total = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+    count_2 = Column(Integer, nullable=False, default=0)
+    count_3 = Column(Integer, nullable=False, default=0)
+    count_4 = Column(Integer, nullable=False, default=0)
+    count_5 = Column(Integer, nullable=False, default=0)
+
+def mark_values(ref):
+    return f"{ref}.mark, 1, " + ", ".join(f"{ref}.mark = {mark}" for mark in MARK_HISTOGRAM.values())
+
+def mark_delta(ref, sign):
+    terms = [f"total = total {sign} {ref}.mark", f"count = count {sign} 1"]
+    terms += [f"{column} = {column} {sign} ({ref}.mark = {mark})" for column, mark in MARK_HISTOGRAM.items()]
+    return ", ".join(terms)
+
+def grades_delta(sign):
+    return ", ".join(f"{column} = GroupGrades.{column} {sign} sg.{column}" for column in ["total", "count", *MARK_HISTOGRAM])
+
+GRADE_COLUMNS = "total, count, " + ", ".join(MARK_HISTOGRAM)
+GRADE_UPSERT = "ON CONFLICT DO UPDATE SET " + ", ".join(f"{column} = {column} + excluded.{column}" for column in ["total", "count", *MARK_HISTOGRAM])
+
+def add_mark_sql(ref):
+    return f"""
+    INSERT INTO StudentGrades (student_id, group_id, {GRADE_COLUMNS})
+    SELECT {ref}.student_id, group_id, {mark_values(ref)} FROM Students WHERE id = {ref}.student_id
+    {GRADE_UPSERT};
+    INSERT INTO GroupGrades (group_id, {GRADE_COLUMNS})
+    SELECT group_id, {mark_values(ref)} FROM StudentGrades WHERE student_id = {ref}.student_id
+    {GRADE_UPSERT};"""
+
+def remove_mark_sql(ref):
+    return f"""
+    UPDATE GroupGrades SET {mark_delta(ref, "-")}
+    WHERE group_id = (SELECT group_id FROM StudentGrades WHERE student_id = {ref}.student_id);
+    UPDATE StudentGrades SET {mark_delta(ref, "-")} WHERE student_id = {ref}.student_id;"""
+
+GRADE_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS marks_grades_insert AFTER INSERT ON Marks WHEN NEW.mark IS NOT NULL
+    BEGIN {add_mark_sql("NEW")}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS marks_grades_delete AFTER DELETE ON Marks WHEN OLD.mark IS NOT NULL
+    BEGIN {remove_mark_sql("OLD")}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS marks_grades_update_old AFTER UPDATE OF student_id, mark ON Marks WHEN OLD.mark IS NOT NULL
+    BEGIN {remove_mark_sql("OLD")}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS marks_grades_update_new AFTER UPDATE OF student_id, mark ON Marks WHEN NEW.mark IS NOT NULL
+    BEGIN {add_mark_sql("NEW")}
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS students_grades_move AFTER UPDATE OF group_id ON Students WHEN OLD.group_id IS NOT NEW.group_id
+    BEGIN
+    UPDATE GroupGrades SET {grades_delta("-")}
+    FROM StudentGrades sg WHERE sg.student_id = NEW.id AND GroupGrades.group_id = OLD.group_id;
+    INSERT INTO GroupGrades (group_id, {GRADE_COLUMNS})
+    SELECT NEW.group_id, {GRADE_COLUMNS} FROM StudentGrades WHERE student_id = NEW.id
+    {GRADE_UPSERT};
+    UPDATE StudentGrades SET group_id = NEW.group_id WHERE student_id = NEW.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS students_grades_delete AFTER DELETE ON Students
+    BEGIN
+    UPDATE GroupGrades SET {grades_delta("-")}
+    FROM StudentGrades sg WHERE sg.student_id = OLD.id AND GroupGrades.group_id = sg.group_id;
+    DELETE FROM StudentGrades WHERE student_id = OLD.id;
+    END""",
+]
+
+REBUILD_GRADES = [
+    "DELETE FROM StudentGrades",
+    "DELETE FROM GroupGrades",
+    # marks of closed terms only survive as ArchivedMarks counts
+    f"""INSERT INTO StudentGrades (student_id, group_id, {GRADE_COLUMNS})
+    SELECT m.student_id, s.group_id, SUM(m.mark * m.n), SUM(m.n), {", ".join(f"SUM((m.mark = {mark}) * m.n)" for mark in MARK_HISTOGRAM.values())}
+    FROM (SELECT student_id, mark, 1 AS n FROM Marks WHERE mark IS NOT NULL
+          UNION ALL SELECT student_id, mark, count FROM ArchivedMarks) m
+    JOIN Students s ON s.id = m.student_id GROUP BY m.student_id""",
+    f"""INSERT INTO GroupGrades (group_id, {GRADE_COLUMNS})
+    SELECT group_id, {", ".join(f"SUM({column})" for column in ["total", "count", *MARK_HISTOGRAM])}
+    FROM StudentGrades GROUP BY group_id""",
+]
+
+for trigger in GRADE_TRIGGERS:
+    event.listen(Base.metadata, "after_create", DDL(trigger))
+
+# derived tables are filled once when they are added to a database that already has data
+def backfill_on_create(table, statements):
+    @event.listens_for(table, "after_create")
+    def created(target, connection, **kw):
+        connection.info.setdefault("backfill", []).extend(statements)
+
+@event.listens_for(Base.metadata, "after_create")
+def run_backfill(target, connection, **kw):
+    for statement in connection.info.pop("backfill", []):
+        connection.exec_driver_sql(statement)
+
+backfill_on_create(StudentGrade.__table__, REBUILD_GRADES)
+
+
+# --------------------------------------- TIMETABLE ----------------------------------------
+# denormalized, time-ordered copy of the schedule join (Lessons + Groups + Courses + Teachers),
+# one row per lesson; triggers re-materialize only the lessons touched by a write
+
+class ScheduleEntry(Base):
+    __tablename__ = "ScheduleEntries"
+    __table_args__ = (
+        Index("ix_schedule_entries_group_id_time", "group_id", "time"),
+        Index("ix_schedule_entries_teacher_id_time", "teacher_id", "time"),
+    )
+
+    lesson_id = Column(Integer, primary_key=True)
+    group_id = Column(Integer, nullable=False)
+    teacher_id = Column(Integer, nullable=False)
+    course_id = Column(Integer, nullable=False)
+    time = Column(LessonTime, nullable=False)
+    group_name = Column(String, nullable=False)
+    course = Column(String, nullable=False)
+    teacher = Column(String, nullable=False)
+
+def materialize_sql(where):
+    return f"""INSERT OR REPLACE INTO ScheduleEntries
+    (lesson_id, group_id, teacher_id, course_id, time, group_name, course, teacher)
+    SELECT l.id, l.group_id, l.teacher_id, l.course_id, l.time, g.name_number, c.title, t.name
+    FROM Lessons l
+    JOIN Groups g ON g.id = l.group_id
+    JOIN Courses c ON c.id = l.course_id
+    JOIN Teachers t ON t.id = l.teacher_id
+    WHERE {where}"""
+
+SCHEDULE_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS lessons_schedule_insert AFTER INSERT ON Lessons
+    BEGIN {materialize_sql("l.id = NEW.id")}; END""",
+    f"""CREATE TRIGGER IF NOT EXISTS lessons_schedule_update AFTER UPDATE ON Lessons
+    BEGIN DELETE FROM ScheduleEntries WHERE lesson_id = OLD.id; {materialize_sql("l.id = NEW.id")}; END""",
+    """CREATE TRIGGER IF NOT EXISTS lessons_schedule_delete AFTER DELETE ON Lessons
+    BEGIN DELETE FROM ScheduleEntries WHERE lesson_id = OLD.id; END""",
+]
+for table, column in (("Groups", "group_id"), ("Courses", "course_id"), ("Teachers", "teacher_id")):
+    name = table.lower()
+    SCHEDULE_TRIGGERS += [
+        f"""CREATE TRIGGER IF NOT EXISTS {name}_schedule_insert AFTER INSERT ON {table}
+        BEGIN {materialize_sql(f"l.{column} = NEW.id")}; END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {name}_schedule_update AFTER UPDATE ON {table}
+        BEGIN {materialize_sql(f"l.{column} = NEW.id")}; END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {name}_schedule_delete AFTER DELETE ON {table}
+        BEGIN DELETE FROM ScheduleEntries WHERE {column} = OLD.id; END""",
+    ]
+
+REBUILD_SCHEDULE = ["DELETE FROM ScheduleEntries", materialize_sql("true")]
+
+for trigger in SCHEDULE_TRIGGERS:
+    event.listen(Base.metadata, "after_create", DDL(trigger))
+
+backfill_on_create(ScheduleEntry.__table__, REBUILD_SCHEDULE)
+
+
+# --------------------------------------- CHANGE LOG ---------------------------------------
+# every insert/update/delete on the nine tables is appended to Changes by triggers, so CRUD, bulk
+# upserts, the delete cascades below and raw scripts are all captured in their own
+# transaction; SQLite has a single writer, so seq order is commit order
+
+class Change(Base):
+    __tablename__ = "Changes"
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    seq = Column(Integer, primary_key=True)
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    data = Column(String)
+    changed_at = Column(String, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+
+# highest seq dropped by retention; consumers behind it have to resync from since=0
+class ChangeHorizon(Base):
+    __tablename__ = "ChangeHorizon"
+
+    id = Column(Integer, primary_key=True)
+    seq = Column(Integer, nullable=False)
+
+CHANGE_TABLES = [model.__table__ for model in (Curator, Group, Student, Course, Mark, Degree, Position, Teacher, Lesson)]
+
+def row_json(table, ref):
+    return "json_object(" + ", ".join(f"'{column.name}', {ref}.{column.name}" for column in table.columns) + ")"
+
+CHANGE_TRIGGERS = []
+for table in CHANGE_TABLES:
+    for op, ref in (("insert", "NEW"), ("update", "NEW"), ("delete", "OLD")):
+        data = "NULL" if op == "delete" else row_json(table, ref)
+        CHANGE_TRIGGERS.append(f"""CREATE TRIGGER IF NOT EXISTS {table.name.lower()}_changes_{op} AFTER {op.upper()} ON {table.name}
+        BEGIN INSERT INTO Changes (table_name, row_id, op, data) VALUES ('{table.name}', {ref}.id, '{op}', {data}); END""")
+
+for trigger in CHANGE_TRIGGERS:
+    event.listen(Base.metadata, "after_create", DDL(trigger))
+
+# existing rows enter the log once as inserts, so reading from since=0 is a full snapshot
+SNAPSHOT_CHANGES = [
+    f"INSERT INTO Changes (table_name, row_id, op, data) SELECT '{table.name}', id, 'insert', {row_json(table, table.name)} FROM {table.name} ORDER BY id"
+    for table in CHANGE_TABLES
+]
+
+backfill_on_create(Change.__table__, SNAPSHOT_CHANGES)
+
+
+# ---------------------------------------- CASCADES ----------------------------------------
+# foreign_keys is off on every connection, so ondelete='CASCADE' is carried out by triggers: the
+# dependent rows are deleted in the parent's statement and their own change and grade triggers fire
+
+CASCADES = {}
+for table in CHANGE_TABLES:
+    for key in table.foreign_keys:
+        if key.ondelete == "CASCADE":
+            CASCADES.setdefault(key.column.table.name, []).append((table.name, key.parent.name))
+
+CASCADE_TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS {parent.lower()}_cascade_{child.lower()} AFTER DELETE ON {parent}
+    BEGIN DELETE FROM {child} WHERE {column} = OLD.id; END"""
+    for parent, children in CASCADES.items() for child, column in children
+]
+
+
+# ----------------------------------------- SEARCH -----------------------------------------
+# FTS5 indexes over the name columns; external content, so the names are stored once and the
+# virtual table holds only the token index. unicode61 folds case for Cyrillic as well as Latin;
+# prefixes of 2-6 characters get their own index, so a search-as-you-type query reads one doclist
+# lazily instead of merging the doclists of every term it expands to
+
+SEARCH_TABLES = {"student": Student.__table__, "teacher": Teacher.__table__, "curator": Curator.__table__}
+
+def search_table(table):
+    return f"{table.name}Search"
+
+# every word of q becomes a quoted prefix term, so input never reaches the FTS5 query syntax
+def match_query(q):
+    return " ".join(f'"{term}"*' for term in re.findall(r"\w+", q))
+
+SEARCH_TRIGGERS = []
+for table in SEARCH_TABLES.values():
+    fts = search_table(table)
+    name = table.name.lower()
+    SEARCH_TRIGGERS += [
+        f"""CREATE TRIGGER IF NOT EXISTS {name}_search_insert AFTER INSERT ON {table.name}
+        BEGIN INSERT INTO {fts} (rowid, name) VALUES (NEW.id, NEW.name); END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {name}_search_update AFTER UPDATE OF name ON {table.name}
+        BEGIN INSERT INTO {fts} ({fts}, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+        INSERT INTO {fts} (rowid, name) VALUES (NEW.id, NEW.name); END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {name}_search_delete AFTER DELETE ON {table.name}
+        BEGIN INSERT INTO {fts} ({fts}, rowid, name) VALUES ('delete', OLD.id, OLD.name); END""",
+    ]
+
+REBUILD_SEARCH = [f"INSERT INTO {search_table(table)} ({search_table(table)}) VALUES ('rebuild')" for table in SEARCH_TABLES.values()]
+
+# virtual tables are not part of the metadata; they are created (and filled from existing rows)
+# before the triggers that write to them
+@event.listens_for(Base.metadata, "after_create")
+def create_search_tables(target, connection, **kw):
+    existing = set(connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table'").scalars())
+    for table in SEARCH_TABLES.values():
+        fts = search_table(table)
+        if fts not in existing:
+            connection.exec_driver_sql(f"""CREATE VIRTUAL TABLE {fts} USING fts5(name, content='{table.name}', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5 6')""")
+            connection.exec_driver_sql(f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')")
+    for trigger in SEARCH_TRIGGERS:
+        connection.exec_driver_sql(trigger)
+
+
+# ----------------------------------------- TERMS ------------------------------------------
+# closing a term moves its marks into a per-term SQLite file that is only ever ATTACHed read-only;
+# the live database keeps their per-(student, course, mark) counts, so StudentGrades, GroupGrades
+# and the analytics arrays still cover all history while Marks only holds the current term
+
+class Term(Base):
+    __tablename__ = "Terms"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String, nullable=False, unique=True)
+    path = Column(String, nullable=False)
+    last_mark_id = Column(Integer, nullable=False)
+    marks = Column(Integer, nullable=False)
+    closed_at = Column(String, nullable=False, server_default=text("CURRENT_TIMESTAMP"))
+
+class ArchivedMark(Base):
+    __tablename__ = "ArchivedMarks"
+
+    student_id = Column(Integer, primary_key=True)
+    course_id = Column(Integer, primary_key=True)
+    mark = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False)
+
+# schema of a term file: Marks as it was, without the foreign keys into the live database
+ARCHIVE_SCHEMA = [
+    "CREATE TABLE {schema}.Marks (id INTEGER PRIMARY KEY, course_id INTEGER NOT NULL, student_id INTEGER NOT NULL, mark INTEGER)",
+    "CREATE INDEX {schema}.ix_marks_student_id ON Marks (student_id)",
+    "CREATE INDEX {schema}.ix_marks_course_id ON Marks (course_id)",
+]
+
+# AUTOINCREMENT only covers the ids sqlite picks; a write naming the id of an archived mark is refused
+CLOSED_TERM_TRIGGER = """CREATE TRIGGER IF NOT EXISTS marks_closed_term_insert AFTER INSERT ON Marks
+    WHEN NEW.id <= (SELECT MAX(last_mark_id) FROM Terms)
+    BEGIN SELECT RAISE(ABORT, 'the mark id belongs to a closed term'); END"""
+
+
+# --------------------------------------- MIGRATIONS ---------------------------------------
+# PRAGMA user_version counts the migrations a database file has been through; each one runs in
+# a single transaction with its checks, and a failing check leaves the file untouched
+
+# DD.MM.YYYY[ rest] -> YYYY-MM-DD[ rest]; everything else is left to sqlite's date functions
+def dotted_to_iso(column):
+    return (f"CASE WHEN {column} GLOB '[0-9][0-9].[0-9][0-9].[0-9][0-9][0-9][0-9]*' "
+            f"THEN substr({column}, 7, 4) || '-' || substr({column}, 4, 2) || '-' || substr({column}, 1, 2) || substr({column}, 11) "
+            f"ELSE {column} END")
+
+LESSON_TIME_SQL = f"strftime('%Y-%m-%dT%H:%M:%S', trim({dotted_to_iso('time')}))"
+# sqlite reads a bare "08:30" as 2000-01-01T08:30:00; a time of day without a date (the weekly slots
+# of query_list/in_lessons) has no day to put it on, so it is left alone and fails the check
+LESSON_HAS_DATE_SQL = f"trim({dotted_to_iso('time')}) GLOB '*[0-9]-[0-9]*'"
+BIRTHDAY_SQL = f"date(trim({dotted_to_iso('birthday')}))"
+
+# sqlite cannot add AUTOINCREMENT to a table, so Marks is copied into a new one; dropping Marks
+# drops its indexes and triggers, and the cascade trigger deleting from it would fail the rename
+def rebuild_marks():
+    table = Mark.__table__
+    cascades = [trigger for trigger in CASCADE_TRIGGERS if f"DELETE FROM {table.name} " in trigger]
+    create = str(CreateTable(table).compile(dialect=sqlite.dialect()))
+    return [
+        *(f"DROP TRIGGER {trigger.split()[5]}" for trigger in cascades),
+        create.replace(f'CREATE TABLE "{table.name}"', 'CREATE TABLE "MarksRebuilt"', 1),
+        "INSERT INTO MarksRebuilt SELECT id, course_id, student_id, mark FROM Marks",
+        "DROP TABLE Marks",
+        "ALTER TABLE MarksRebuilt RENAME TO Marks",
+        *(str(CreateIndex(index).compile(dialect=sqlite.dialect())) for index in table.indexes),
+        *(trigger for trigger in GRADE_TRIGGERS + CHANGE_TRIGGERS if re.search(rf" ON {table.name}\s", trigger)),
+        *cascades,
+        CLOSED_TERM_TRIGGER,
+        # the next id is past every archived one even when the live table is empty
+        "DELETE FROM sqlite_sequence WHERE name = 'Marks'",
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'Marks', "
+        "MAX(COALESCE((SELECT MAX(id) FROM Marks), 0), COALESCE((SELECT MAX(last_mark_id) FROM Terms), 0))",
+    ]
+
+MIGRATIONS = [
+    {
+        # free-form Lessons.time / Students.birthday text -> LessonTime / Date; offsets are converted to UTC
+        "statements": [
+            f"UPDATE Lessons SET time = {LESSON_TIME_SQL} WHERE {LESSON_HAS_DATE_SQL} AND {LESSON_TIME_SQL} IS NOT NULL "
+            f"AND time IS NOT {LESSON_TIME_SQL}",
+            f"UPDATE Students SET birthday = {BIRTHDAY_SQL} WHERE {BIRTHDAY_SQL} IS NOT NULL AND birthday IS NOT {BIRTHDAY_SQL}",
+        ],
+        "checks": {
+            "Lessons with an unreadable time or no date": "SELECT id FROM Lessons WHERE time NOT GLOB '*[0-9]-[0-9]*' "
+                                                            "OR time IS NOT strftime('%Y-%m-%dT%H:%M:%S', time)",
+            "Students with an unreadable birthday": "SELECT id FROM Students WHERE birthday IS NOT date(birthday)",
+        },
+    },
+    {
+        # rows left behind by parent deletes before CASCADE_TRIGGERS existed are deleted (and logged) now
+        "statements": [
+            *CASCADE_TRIGGERS,
+            *(f"DELETE FROM {child} WHERE {column} NOT IN (SELECT id FROM {parent})"
+              for parent, children in CASCADES.items() for child, column in children),
+        ],
+        "checks": {},
+    },
+    {
+        # Marks ids are no longer reused once a closed term has taken them
+        "statements": rebuild_marks(),
+        "checks": {},
+    },
+]
@@ -0,0 +1,261 @@
+import cProfile
+import inspect
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import Response
+
+PROFILING = os.environ.get("PROFILING", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+
+logger = logging.getLogger("profiling")
+
+current = ContextVar("request_stats", default=None)
+
+
+class RequestStats:
+    def __init__(self):
+        self.statements = Counter()
+        self.sql_time = 0.0
+        self.rows = 0
+        self.lazy_loads = 0
+        self.endpoint_time = 0.0
+
+
+class Histogram:
+    def __init__(self, name, help, buckets):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.counts = defaultdict(lambda: [0] * (len(buckets) + 1))
+        self.sums = defaultdict(float)
+
+    def observe(self, labels, value):
+        counts = self.counts[labels]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.sums[labels] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, counts in self.counts.items():
+            label = ",".join(f'{key}="{value}"' for key, value in labels)
+            cumulative = 0
+            for bound, count in zip([*self.buckets, "+Inf"], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {self.sums[labels]}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+class CounterMetric:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = defaultdict(int)
+
+    def inc(self, labels, value=1):
+        self.values[labels] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in self.values.items():
+            label = ",".join(f'{key}="{value}"' for key, value in labels)
+            lines.append(f"{self.name}{{{label}}} {value}")
+        return lines
+
+
+class GaugeMetric:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = defaultdict(int)
+
+    def set(self, labels, value):
+        self.values[labels] = value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for labels, value in self.values.items():
+            label = ",".join(f'{key}="{value}"' for key, value in labels)
+            lines.append(f"{self.name}{{{label}}} {value}")
+        return lines
+
+
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+AMOUNTS = (0, 1, 2, 5, 10, 25, 50, 100, 1000, 10000, 100000)
+
+METRICS = {
+    "wall": Histogram("http_request_duration_seconds", "Wall time per request", SECONDS),
+    "sql_time": Histogram("sql_duration_seconds", "Time spent in SQL per request", SECONDS),
+    "serialization": Histogram("serialization_duration_seconds", "Time after the endpoint returned", SECONDS),
+    "statements": Histogram("sql_statements_per_request", "SQL statements per request", AMOUNTS),
+    "rows": Histogram("sql_rows_per_request", "Rows fetched per request", AMOUNTS),
+    "lazy_loads": CounterMetric("orm_lazy_loads_total", "Relationship loads triggered by attribute access"),
+    "n_plus_one": CounterMetric("n_plus_one_total", "Requests repeating one statement N_PLUS_ONE_THRESHOLD+ times"),
+}
+metrics_lock = threading.Lock()
+
+
+def render_metrics():
+    with metrics_lock:
+        return "\n".join(line for metric in METRICS.values() for line in metric.render()) + "\n"
+
+
+def metrics_response():
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# sqlite3 cursors that count fetched rows into the current request; aiosqlite fetches on its
+# own thread outside the request context, so rows are only counted in the sync DB_MODE
+class CountingCursor(sqlite3.Cursor):
+    def fetchone(self):
+        row = super().fetchone()
+        stats = current.get()
+        if stats is not None and row is not None:
+            stats.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = super().fetchmany() if size is None else super().fetchmany(size)
+        stats = current.get()
+        if stats is not None:
+            stats.rows += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = super().fetchall()
+        stats = current.get()
+        if stats is not None:
+            stats.rows += len(rows)
+        return rows
+
+
+class CountingConnection(sqlite3.Connection):
+    def cursor(self, factory=CountingCursor):
+        return super().cursor(factory)
+
+
+def connect_args():
+    return {"factory": CountingConnection} if PROFILING else {}
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = current.get()
+        if stats is not None:
+            stats.statements[statement] += 1
+            stats.sql_time += elapsed
+
+
+@event.listens_for(Session, "do_orm_execute")
+def count_lazy_loads(orm_execute_state):
+    stats = current.get()
+    if stats is not None and orm_execute_state.is_relationship_load:
+        stats.lazy_loads += 1
+
+
+def dump_profile(profile, name):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profile.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{time.time_ns()}.prof"))
+
+
+# wraps the endpoint so its own time (and optionally a cProfile of it) is known,
+# keeping the signature FastAPI builds dependencies from
+def timed(endpoint):
+    def start():
+        profile = cProfile.Profile() if PROFILE_DIR else None
+        if profile:
+            profile.enable()
+        return profile, time.perf_counter()
+
+    def finish(profile, started):
+        stats = current.get()
+        if stats is not None:
+            stats.endpoint_time += time.perf_counter() - started
+        if profile:
+            profile.disable()
+            dump_profile(profile, endpoint.__name__)
+
+    if inspect.iscoroutinefunction(endpoint):
+        async def wrapper(*args, **kwargs):
+            profile, started = start()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                finish(profile, started)
+    else:
+        def wrapper(*args, **kwargs):
+            profile, started = start()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                finish(profile, started)
+
+    wrapper.__name__ = endpoint.__name__
+    wrapper.__doc__ = endpoint.__doc__
+    wrapper.__dict__.update(endpoint.__dict__)
+    wrapper.__signature__ = inspect.signature(endpoint)
+    return wrapper
+
+
+def instrumented(route_class):
+    class InstrumentedRoute(route_class):
+        def __init__(self, path, endpoint, **kwargs):
+            super().__init__(path, timed(endpoint), **kwargs)
+
+    return InstrumentedRoute
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        stats = RequestStats()
+        token = current.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            current.reset(token)
+        wall = time.perf_counter() - started
+        route = request.scope.get("route")
+        labels = (("method", request.method), ("route", route.path if route else "unmatched"))
+        statements = sum(stats.statements.values())
+        with metrics_lock:
+            METRICS["wall"].observe(labels, wall)
+            METRICS["sql_time"].observe(labels, stats.sql_time)
+            METRICS["serialization"].observe(labels, max(0.0, wall - stats.endpoint_time))
+            METRICS["statements"].observe(labels, statements)
+            METRICS["rows"].observe(labels, stats.rows)
+            if stats.lazy_loads:
+                METRICS["lazy_loads"].inc(labels, stats.lazy_loads)
+            repeated = [sql for sql, count in stats.statements.items() if count >= N_PLUS_ONE_THRESHOLD]
+            if repeated:
+                METRICS["n_plus_one"].inc(labels)
+        for sql in repeated:
+            logger.warning("N+1 on %s %s: %dx %s", request.method, labels[1][1], stats.statements[sql], sql)
+        response.headers["Server-Timing"] = (
+            f"total;dur={wall * 1000:.2f}, sql;dur={stats.sql_time * 1000:.2f}, "
+            f"serialize;dur={max(0.0, wall - stats.endpoint_time) * 1000:.2f}"
+        )
+        response.headers["X-SQL-Statements"] = str(statements)
+        return response
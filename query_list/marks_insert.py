@@ -3,6 +3,5 @@ import sqlite3
 con = sqlite3.connect("University.db")
 cur = con.cursor()
 
-for i in range(1000):
-    cur.execute("INSERT INTO Marks (course_id, student_id, mark) VALUES (ABS(RANDOM()) % 7 + 1, ABS(RANDOM()) % 315 + 1, ABS(RANDOM()) % 4 + 2);")
+cur.executemany("INSERT INTO Marks (course_id, student_id, mark) VALUES (ABS(RANDOM()) % 7 + 1, ABS(RANDOM()) % 315 + 1, ABS(RANDOM()) % 4 + 2);", [()] * 1000)
 con.commit()
\ No newline at end of file
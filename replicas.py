@@ -0,0 +1,174 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+REPLICA_MODE = os.environ.get("REPLICA_MODE", "off")
+REPLICA_URLS = [url for url in os.environ.get("REPLICA_URLS", "").split(",") if url]
+REPLICA_COUNT = int(os.environ.get("REPLICA_COUNT", 2))
+REPLICA_DIR = os.environ.get("REPLICA_DIR")
+REPLICA_MAX_LAG = float(os.environ.get("REPLICA_MAX_LAG", 60))
+REPLICA_REFRESH = float(os.environ.get("REPLICA_REFRESH", 30))
+
+logger = logging.getLogger(__name__)
+
+# pragmas of the primary that would write to the replica file are left out
+READ_ONLY_PRAGMAS = ("journal_mode", "synchronous")
+
+
+def replica_read(func):
+    func.replica_read = True
+    return func
+
+
+class Replica:
+    def __init__(self, name, engine, path=None):
+        self.name = name
+        self.engine = engine
+        # snapshot copy file; None for replicas that read live data (mode=ro, REPLICA_URLS)
+        self.path = path
+        self.seq = None
+        self.refreshed_at = None
+        self.refreshing = False
+
+    # a snapshot that was never copied (its first refresh failed) is infinitely stale
+    def age(self):
+        if self.path is None:
+            return 0.0
+        return math.inf if self.refreshed_at is None else time.monotonic() - self.refreshed_at
+
+    def status(self):
+        age = self.age()
+        return {"name": self.name, "snapshot": self.path is not None, "seq": self.seq,
+                "age": None if age == math.inf else round(age, 3), "refreshing": self.refreshing}
+
+
+# snapshot replicas are copies of the primary file made with the sqlite online backup API;
+# one is refreshed at a time in the background while the others keep serving. the workers share
+# the files: a copy is made under an flock on <replica>.lock, which then holds the copied seq and
+# whose mtime is the copy time, so a worker that gets the lock after another one copied adopts
+# that copy instead of making its own
+class ReplicaSet:
+    def __init__(self, primary_path, replicas, max_lag, refresh):
+        self.primary_path = primary_path
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.refresh_after = refresh
+        self.lock = threading.Lock()
+        self.next = 0
+
+    # the seq is read in the same read transaction the backup copies from
+    def copy(self, replica):
+        source = sqlite3.connect(self.primary_path)
+        target = sqlite3.connect(replica.path)
+        try:
+            source.execute("BEGIN")
+            seq = source.execute("SELECT COALESCE(MAX(seq), 0) FROM Changes").fetchone()[0]
+            source.backup(target)
+            return seq
+        finally:
+            source.close()
+            target.close()
+
+    def refresh(self, replica, force=False):
+        try:
+            with open(f"{replica.path}.lock", "a+") as stamp:
+                if fcntl is not None:
+                    fcntl.flock(stamp, fcntl.LOCK_EX)
+                stamp.seek(0)
+                seq = stamp.read()
+                copied_at = os.path.getmtime(stamp.name)
+                if force or not seq or not os.path.exists(replica.path) or time.time() - copied_at >= self.refresh_after:
+                    seq = self.copy(replica)
+                    stamp.truncate(0)
+                    stamp.write(str(seq))
+                    stamp.flush()
+                    copied_at = os.path.getmtime(stamp.name)
+                with self.lock:
+                    replica.seq = int(seq)
+                    replica.refreshed_at = time.monotonic() - (time.time() - copied_at)
+        finally:
+            replica.refreshing = False
+
+    def refresh_all(self):
+        for replica in self.replicas:
+            if replica.path is not None:
+                replica.refreshing = True
+                self.refresh(replica, force=True)
+
+    # a copy that cannot be made keeps the replica's previous state and is retried later
+    def try_refresh(self, replica):
+        try:
+            self.refresh(replica)
+        except (sqlite3.Error, OSError) as error:
+            logger.warning("replica %s not refreshed: %s", replica.name, error)
+
+    # workers started after a pre-fork refresh reuse the copies; one that cannot be made now is
+    # left unrefreshed, never picked, and retried by the background refresh
+    def adopt(self):
+        for replica in self.replicas:
+            if replica.path is None:
+                continue
+            replica.refreshing = True
+            self.try_refresh(replica)
+
+    def refresh_in_background(self):
+        with self.lock:
+            idle = [r for r in self.replicas if r.path is not None and not r.refreshing]
+            if not idle or any(r.refreshing for r in self.replicas):
+                return
+            replica = max(idle, key=Replica.age)
+            if replica.age() < self.refresh_after:
+                return
+            replica.refreshing = True
+        threading.Thread(target=self.try_refresh, args=(replica,), daemon=True).start()
+
+    # a replica that is within max_lag and has seen min_seq, round robin; None means use the primary
+    def pick(self, min_seq=None):
+        self.refresh_in_background()
+        with self.lock:
+            candidates = [
+                r for r in self.replicas
+                if not r.refreshing and r.age() <= self.max_lag
+                and (min_seq is None or r.path is None or r.seq >= min_seq)
+            ]
+            if not candidates:
+                return None
+            self.next += 1
+            return candidates[self.next % len(candidates)]
+
+    def status(self):
+        with self.lock:
+            return [replica.status() for replica in self.replicas]
+
+
+def replica_paths(primary_path):
+    directory = REPLICA_DIR or os.path.dirname(os.path.abspath(primary_path))
+    base = os.path.splitext(os.path.basename(primary_path))[0]
+    return [os.path.join(directory, f"{base}.replica{i}.db") for i in range(REPLICA_COUNT)]
+
+
+# make_engine(url) builds an engine of the current DB_MODE for a replica URL
+def make_replica_set(primary_path, make_engine, refresh=True):
+    if REPLICA_URLS:
+        replicas = [Replica(f"url{i}", make_engine(url)) for i, url in enumerate(REPLICA_URLS)]
+    elif REPLICA_MODE == "ro":
+        replicas = [Replica("ro", make_engine(f"sqlite:///file:{os.path.abspath(primary_path)}?mode=ro&uri=true"))]
+    elif REPLICA_MODE == "snapshot":
+        replicas = [Replica(f"snapshot{i}", make_engine(f"sqlite:///{path}"), path)
+                    for i, path in enumerate(replica_paths(primary_path))]
+    else:
+        return None
+    replica_set = ReplicaSet(primary_path, replicas, REPLICA_MAX_LAG, REPLICA_REFRESH)
+    if refresh:
+        replica_set.refresh_all()
+    else:
+        replica_set.adopt()
+    return replica_set
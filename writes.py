@@ -0,0 +1,79 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy.orm import Session
+
+WRITE_QUEUE = os.environ.get("WRITE_QUEUE", "0") == "1"
+WRITE_BATCH = int(os.environ.get("WRITE_BATCH", 64))
+WRITE_WAIT_MS = float(os.environ.get("WRITE_WAIT_MS", 2))
+
+
+# the handler bodies call db.commit() and db.refresh(); inside a batch commit only flushes,
+# so the rows get their ids and the caller sees its own constraint error, and the batch
+# commits once for all of them
+class BatchSession(Session):
+    def commit(self):
+        self.flush()
+
+
+class WriteQueue:
+    def __init__(self, engine, batch, wait_ms):
+        self.engine = engine
+        self.batch = batch
+        self.wait = wait_ms / 1000
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    # func(session) runs on the writer thread; the future resolves after the batch commits
+    def submit(self, func):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self.run, name="write-queue", daemon=True)
+                    self.thread.start()
+        future = Future()
+        self.queue.put((func, future))
+        return future
+
+    # a batch closes on `batch` ops or `wait` after its first op
+    def run(self):
+        while True:
+            ops = [self.queue.get()]
+            deadline = time.monotonic() + self.wait
+            while len(ops) < self.batch:
+                try:
+                    ops.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            self.commit(ops)
+
+    # every op runs in its own savepoint: a failing op is rolled back alone, together with what
+    # the session events collected for it, and gets its exception; the rest commit together
+    def commit(self, ops):
+        results = []
+        try:
+            with BatchSession(self.engine, expire_on_commit=False) as session:
+                for func, future in ops:
+                    info = {key: value.copy() if hasattr(value, "copy") else value for key, value in session.info.items()}
+                    savepoint = session.begin_nested()
+                    try:
+                        value = func(session)
+                        savepoint.commit()
+                        results.append((future, value, None))
+                    except Exception as error:
+                        savepoint.rollback()
+                        session.info.clear()
+                        session.info.update(info)
+                        results.append((future, None, error))
+                Session.commit(session)
+        except Exception as error:
+            results = [(future, None, error) for _, future in ops]
+        for future, value, error in results:
+            if error is None:
+                future.set_result(value)
+            else:
+                future.set_exception(error)